@@ -0,0 +1,72 @@
+import os
+import pickle
+import hashlib
+
+# Bump when the VM output format changes in a way the source hash cannot see.
+CACHE_FORMAT = 1
+
+# Modules whose code determines the generated VM; editing any of them
+# invalidates every cached fragment.
+COMPILER_MODULES = ('JackTokenizer.py', 'JackParser.py', 'SymbolTable.py', 'VMWriter.py',
+                    'VMCompilationEngine.py', 'Liveness.py', 'JackCompiler.py')
+
+_compiler_version = None
+
+def compilerVersion():
+    global _compiler_version
+    if _compiler_version is None:
+        h = hashlib.sha256(str(CACHE_FORMAT).encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in COMPILER_MODULES:
+            path = os.path.join(here, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+
+class BuildCache:
+    """On-disk cache of compiled VM fragments keyed by source content hash.
+
+    Each entry holds the class's VM text and the per-class info dict the
+    engine reported while compiling it (statistics and the like).
+    """
+
+    def __init__(self, cache_dir, options=''):
+        self.dir = cache_dir
+        # options are folded into the key so differently configured builds don't collide
+        self.options = options
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.dir, exist_ok=True)
+
+    def key(self, class_name, source):
+        # the class name comes from the file name, so it is part of the key too
+        h = hashlib.sha256(compilerVersion().encode())
+        h.update(self.options.encode())
+        h.update(class_name.encode() + b'\0')
+        h.update(source)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.dir, key + '.pkl')
+
+    def get(self, key):
+        # (text, info) or None on a miss
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, text, info):
+        # write then rename, so a concurrent build never sees a partial fragment
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump((text, info), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
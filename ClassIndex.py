@@ -0,0 +1,107 @@
+import os
+import marshal
+from JackTokenizer import JackTokenizer
+
+# Project-wide index of class signatures, built by a prepass that reads only
+# class headers and subroutine declarations (bodies are skipped by brace
+# matching). Cross-class passes ask it what a subroutine is without parsing
+# other classes.
+#
+# A class entry is (name, fields, statics, {subroutine: (kind, returnType, nArgs)});
+# nArgs does not count a method's implicit 'this'.
+# The index is saved as a marshal file, with one entry per .jack file. An
+# entry is rescanned only when that file's mtime or size changes.
+
+INDEX_HEADER = b'JIDX1\n'
+
+def scanSignature(jack_file):
+    values = JackTokenizer(jack_file).tokens
+    name = values[1]
+    fields = statics = 0
+    subroutines = {}
+    i = 3                                 # 'class' name '{'
+    while i < len(values):
+        token = values[i]
+        if token in ('static', 'field'):
+            # kind type name (',' name)* ';'
+            end = values.index(';', i)
+            count = (end - i - 1) // 2
+            if token == 'field':
+                fields += count
+            else:
+                statics += count
+            i = end + 1
+        elif token in ('constructor', 'function', 'method'):
+            # kind returnType name '(' params ')' '{' ... '}'
+            close = values.index(')', i + 4)
+            params = close - i - 4
+            subroutines[values[i + 2]] = (token, values[i + 1], (params + 1) // 3)
+            i = close + 1                 # '{'
+            depth = 0
+            while True:
+                if values[i] == '{':
+                    depth += 1
+                elif values[i] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            i += 1
+        else:
+            break                         # the class's '}'
+    return (name, fields, statics, subroutines)
+
+
+class ClassIndex:
+    def __init__(self, path=None):
+        # path: where the index is persisted, or None to keep it in memory
+        self.path = path
+        self.files = {}                   # .jack path -> (mtime_ns, size, class entry)
+        self.classes = {}                 # class name -> class entry
+        self.scanned = 0                  # files rescanned by the last update()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if data.startswith(INDEX_HEADER):
+            try:
+                self.files = marshal.loads(data[len(INDEX_HEADER):])
+            except (EOFError, ValueError, TypeError):
+                self.files = {}
+
+    def update(self, jack_files):
+        # bring the index in line with jack_files, rescanning changed ones
+        files = {}
+        self.scanned = 0
+        for path in jack_files:
+            key = os.path.abspath(path)
+            st = os.stat(path)
+            entry = self.files.get(key)
+            if entry is None or entry[:2] != (st.st_mtime_ns, st.st_size):
+                entry = (st.st_mtime_ns, st.st_size, scanSignature(path))
+                self.scanned += 1
+            files[key] = entry
+        changed = self.scanned or len(files) != len(self.files)
+        self.files = files
+        self.classes = {entry[2][0]: entry[2] for entry in files.values()}
+        if changed and self.path:
+            self.save()
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(INDEX_HEADER + marshal.dumps(self.files))
+        os.replace(tmp, self.path)
+
+    def subroutine(self, class_name, name):
+        # (kind, returnType, nArgs), or None if unknown
+        entry = self.classes.get(class_name)
+        return entry[3].get(name) if entry else None
+
+    def fieldCount(self, class_name):
+        entry = self.classes.get(class_name)
+        return entry[1] if entry else None
@@ -1,82 +1,134 @@
+from JackParser import parseFile
+from JackTokenizer import STRING_CONST
+
+# XML tag for each token kind code (KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER)
+TAGS = ('keyword', 'symbol', 'integerConstant', 'stringConstant', 'identifier')
+_ESCAPES = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+# pieces collected before XMLOutput writes them out in one call
+_CHUNK = 4096
+
+def tokenLines(stream):
+    # '<tag> value </tag>\n' for every token, built once per file and shared
+    # by T.xml and the parse XML. A token value always has the same kind, so
+    # the line is cached per value.
+    cache = {}
+    lines = []
+    for token, kind in zip(stream.values, stream.kinds):
+        line = cache.get(token)
+        if line is None:
+            value = token.strip('"') if kind == STRING_CONST else _ESCAPES.get(token, token)
+            tag = TAGS[kind]
+            line = cache[token] = f"<{tag}> {value} </{tag}>\n"
+        lines.append(line)
+    return lines
+
+def writeTokens(stream, output_file, lines=None):
+    # the T.xml token listing
+    out = XMLOutput(output_file)
+    out.write("<tokens>\n")
+    for line in lines or tokenLines(stream):
+        out.write('  ' + line)
+    out.write("</tokens>\n")
+    out.close()
+
+
+class XMLOutput:
+    """Text file written in chunks: pieces are joined and written every _CHUNK writes."""
+
+    def __init__(self, output_file):
+        self.file = open(output_file, 'w')
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        if len(self.parts) >= _CHUNK:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.parts))
+        self.parts.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
 class CompilationEngine:
-    def __init__(self, tokenizer, output_file):
+    # Writes the parse-tree XML by walking the JackParser AST. The tree gives
+    # the nesting; the terminals are taken in order from the token stream, so
+    # every token is written exactly as it was scanned.
+    # With tokens_file, T.xml is written in the same pass from the same lines.
+    def __init__(self, tokenizer, output_file, tokens_file=None, lines=None):
         self.tokenizer = tokenizer
-        self.output = open(output_file, 'w')
+        self.output = XMLOutput(output_file)
+        self.tokens_output = XMLOutput(tokens_file) if tokens_file else None
+        self.lines = lines or tokenLines(tokenizer.stream)
+        self.indents = ['']
         self.indent_level = 0
-        self.tokenizer.advance()
+        self.index = 0
 
-    def _write_indent(self):
-        self.output.write('  ' * self.indent_level)
+    def _indent(self):
+        # indent prefixes are built once per depth
+        while len(self.indents) <= self.indent_level:
+            self.indents.append('  ' * len(self.indents))
+        return self.indents[self.indent_level]
 
     def write_start(self, tag):
-        self._write_indent()
-        self.output.write(f"<{tag}>\n")
+        self.output.write(self._indent() + '<' + tag + '>\n')
         self.indent_level += 1
 
     def write_end(self, tag):
         self.indent_level -= 1
-        self._write_indent()
-        self.output.write(f"</{tag}>\n")
-
-    def write_token(self, tag, value):
-        self._write_indent()
-        self.output.write(f"<{tag}> {value} </{tag}>\n")
-
-    def writeTokenAndAdvance(self):
-        token = self.tokenizer.token()
-        ttype = self.tokenizer.tokenType()
-        # Map JackTokenizer types to XML tags
-        tag_map = {
-            'KEYWORD': 'keyword',
-            'SYMBOL': 'symbol',
-            'IDENTIFIER': 'identifier',
-            'INT_CONST': 'integerConstant',
-            'STRING_CONST': 'stringConstant'
-        }
-        tag = tag_map[ttype]
-        value = token
-        if token == '<': value = '&lt;'
-        elif token == '>': value = '&gt;'
-        elif token == '&': value = '&amp;'
-        elif tag == 'stringConstant': value = token.strip('"')
-        self.write_token(tag, value)
-        self.tokenizer.advance()
-
-    def compileClass(self):
+        self.output.write(self._indent() + '</' + tag + '>\n')
+
+    def writeTokenAndAdvance(self, count=1):
+        indent = self._indent()
+        write = self.output.write
+        for line in self.lines[self.index:self.index + count]:
+            write(indent + line)
+        if self.tokens_output is not None:
+            for line in self.lines[self.index:self.index + count]:
+                self.tokens_output.write('  ' + line)
+        self.index += count
+
+    def compileClass(self, tree=None):
+        # tree: the JackParser AST, parsed from the tokenizer if not given
+        if tree is None:
+            tree = parseFile(self.tokenizer)
+        _, _, _, class_vars, subroutines = tree
+        if self.tokens_output is not None:
+            self.tokens_output.write("<tokens>\n")
         self.write_start('class')
         # 'class' className '{'
-        for _ in range(3):
-            self.writeTokenAndAdvance()
+        self.writeTokenAndAdvance(3)
         # classVarDec*
-        while self.tokenizer.token() in ('static', 'field'):
-            self.compileClassVarDec()
+        for dec in class_vars:
+            self.compileClassVarDec(dec)
         # subroutineDec*
-        while self.tokenizer.token() in ('constructor', 'function', 'method'):
-            self.compileSubroutine()
+        for node in subroutines:
+            self.compileSubroutine(node)
         # '}' class end
         self.writeTokenAndAdvance()
         self.write_end('class')
         self.output.close()
+        if self.tokens_output is not None:
+            # anything after the class still belongs in the token listing
+            for line in self.lines[self.index:]:
+                self.tokens_output.write('  ' + line)
+            self.tokens_output.write("</tokens>\n")
+            self.tokens_output.close()
 
-    def compileClassVarDec(self):
+    def compileClassVarDec(self, dec):
         self.write_start('classVarDec')
         # ('static'|'field') type varName (',' varName)* ';'
-        for _ in range(3):
-            self.writeTokenAndAdvance()
-        while self.tokenizer.token() == ',':
-            self.writeTokenAndAdvance()
-            self.writeTokenAndAdvance()
-        self.writeTokenAndAdvance()
+        self.writeTokenAndAdvance(2 * len(dec[2]) + 2)
         self.write_end('classVarDec')
 
-    def compileSubroutine(self):
+    def compileSubroutine(self, node):
         self.write_start('subroutineDec')
-        # ('constructor'|'function'|'method') returnType subroutineName
-        for _ in range(3):
-            self.writeTokenAndAdvance()
-        # '('
-        self.writeTokenAndAdvance()
-        self.compileParameterList()
+        # ('constructor'|'function'|'method') returnType subroutineName '('
+        self.writeTokenAndAdvance(4)
+        self.compileParameterList(node[5])
         # ')'
         self.writeTokenAndAdvance()
         # subroutine body
@@ -84,166 +136,137 @@ class CompilationEngine:
         # '{'
         self.writeTokenAndAdvance()
         # varDec*
-        while self.tokenizer.token() == 'var':
-            self.compileVarDec()
+        for dec in node[6]:
+            self.compileVarDec(dec)
         # statements
-        self.compileStatements()
+        self.compileStatements(node[7])
         # '}'
         self.writeTokenAndAdvance()
         self.write_end('subroutineBody')
         self.write_end('subroutineDec')
 
-    def compileParameterList(self):
+    def compileParameterList(self, params):
         self.write_start('parameterList')
-        if self.tokenizer.token() != ')':
-            # type varName (',' type varName)*
-            self.writeTokenAndAdvance()
-            self.writeTokenAndAdvance()
-            while self.tokenizer.token() == ',':
-                self.writeTokenAndAdvance()
-                self.writeTokenAndAdvance()
-                self.writeTokenAndAdvance()
+        # type varName (',' type varName)*
+        if params:
+            self.writeTokenAndAdvance(3 * len(params) - 1)
         self.write_end('parameterList')
 
-    def compileVarDec(self):
+    def compileVarDec(self, dec):
         self.write_start('varDec')
         # 'var' type varName (',' varName)* ';'
-        for _ in range(3):
-            self.writeTokenAndAdvance()
-        while self.tokenizer.token() == ',':
-            self.writeTokenAndAdvance()
-            self.writeTokenAndAdvance()
-        self.writeTokenAndAdvance()
+        self.writeTokenAndAdvance(2 * len(dec[1]) + 2)
         self.write_end('varDec')
 
-    def compileStatements(self):
+    def compileStatements(self, statements):
         self.write_start('statements')
-        while self.tokenizer.token() in ('let', 'if', 'while', 'do', 'return'):
-            stmt = self.tokenizer.token()
-            getattr(self, f'compile{stmt.capitalize()}')()
+        for node in statements:
+            getattr(self, f'compile{node[0].capitalize()}')(node)
         self.write_end('statements')
 
-    def compileLet(self):
+    def compileLet(self, node):
         self.write_start('letStatement')
         # 'let' varName ('[' expression ']')? '=' expression ';'
-        self.writeTokenAndAdvance()  # let
-        self.writeTokenAndAdvance()  # varName
-        if self.tokenizer.token() == '[':
+        self.writeTokenAndAdvance(2)  # let varName
+        if node[3] is not None:
             self.writeTokenAndAdvance()
-            self.compileExpression()
+            self.compileExpression(node[3])
             self.writeTokenAndAdvance()
         self.writeTokenAndAdvance()  # '='
-        self.compileExpression()
+        self.compileExpression(node[4])
         self.writeTokenAndAdvance()  # ';'
         self.write_end('letStatement')
 
-    def compileIf(self):
+    def compileIf(self, node):
         self.write_start('ifStatement')
         # 'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
-        self.writeTokenAndAdvance()  # if
-        self.writeTokenAndAdvance()  # '('
-        self.compileExpression()
-        self.writeTokenAndAdvance()  # ')'
-        self.writeTokenAndAdvance()  # '{'
-        self.compileStatements()
+        self.writeTokenAndAdvance(2)  # if '('
+        self.compileExpression(node[2])
+        self.writeTokenAndAdvance(2)  # ')' '{'
+        self.compileStatements(node[3])
         self.writeTokenAndAdvance()  # '}'
-        if self.tokenizer.token() == 'else':
-            self.writeTokenAndAdvance()  # else
-            self.writeTokenAndAdvance()  # '{'
-            self.compileStatements()
+        if node[4] is not None:
+            self.writeTokenAndAdvance(2)  # else '{'
+            self.compileStatements(node[4])
             self.writeTokenAndAdvance()  # '}'
         self.write_end('ifStatement')
 
-    def compileWhile(self):
+    def compileWhile(self, node):
         self.write_start('whileStatement')
         # 'while' '(' expression ')' '{' statements '}'
-        self.writeTokenAndAdvance()
-        self.writeTokenAndAdvance()
-        self.compileExpression()
-        self.writeTokenAndAdvance()
-        self.writeTokenAndAdvance()
-        self.compileStatements()
+        self.writeTokenAndAdvance(2)
+        self.compileExpression(node[2])
+        self.writeTokenAndAdvance(2)
+        self.compileStatements(node[3])
         self.writeTokenAndAdvance()
         self.write_end('whileStatement')
 
-    def compileDo(self):
+    def compileDo(self, node):
         self.write_start('doStatement')
         # 'do' subroutineCall ';'
         self.writeTokenAndAdvance()
-        self.compileSubroutineCall()
+        self.compileSubroutineCall(node[2])
         self.writeTokenAndAdvance()
         self.write_end('doStatement')
 
-    def compileReturn(self):
+    def compileReturn(self, node):
         self.write_start('returnStatement')
         # 'return' expression? ';'
         self.writeTokenAndAdvance()
-        if self.tokenizer.token() != ';':
-            self.compileExpression()
+        if node[2] is not None:
+            self.compileExpression(node[2])
         self.writeTokenAndAdvance()
         self.write_end('returnStatement')
 
-    def compileExpression(self):
+    def compileExpression(self, node):
         self.write_start('expression')
-        self.compileTerm()
-        while self.tokenizer.token() in ['+', '-', '*', '/', '&', '|', '<', '>', '=']:
+        # term (op term)*: the parser builds the chain left-deep
+        terms = []
+        while node[0] == 'binary':
+            terms.append(node[3])
+            node = node[2]
+        self.compileTerm(node)
+        for term in reversed(terms):
             self.writeTokenAndAdvance()
-            self.compileTerm()
+            self.compileTerm(term)
         self.write_end('expression')
 
-    def compileTerm(self):
+    def compileTerm(self, node):
         self.write_start('term')
-        tokenType = self.tokenizer.tokenType()
-        token = self.tokenizer.token()
-        # integer constant
-        if tokenType == 'INT_CONST':
-            self.writeTokenAndAdvance()
-        # string constant
-        elif tokenType == 'STRING_CONST':
-            self.writeTokenAndAdvance()
-        # keyword constant
-        elif token in ('true', 'false', 'null', 'this'):
-            self.writeTokenAndAdvance()
+        kind = node[0]
         # '(' expression ')'
-        elif token == '(':  
+        if kind == 'paren':
             self.writeTokenAndAdvance()
-            self.compileExpression()
+            self.compileExpression(node[1])
             self.writeTokenAndAdvance()
         # unary op term
-        elif token in ('-', '~'):
+        elif kind == 'unary':
             self.writeTokenAndAdvance()
-            self.compileTerm()
+            self.compileTerm(node[2])
         # varName '[' expression ']'
-        elif self.tokenizer.tokens[self.tokenizer.current_index+1] == '[':
-            self.writeTokenAndAdvance()  # varName
-            self.writeTokenAndAdvance()  # '['
-            self.compileExpression()
+        elif kind == 'index':
+            self.writeTokenAndAdvance(2)  # varName '['
+            self.compileExpression(node[2])
             self.writeTokenAndAdvance()  # ']'
         # subroutine call
-        elif self.tokenizer.tokens[self.tokenizer.current_index+1] in ('.', '('):
-            self.compileSubroutineCall()
-        # varName
+        elif kind == 'call':
+            self.compileSubroutineCall(node)
+        # constant or varName
         else:
             self.writeTokenAndAdvance()
         self.write_end('term')
 
-    def compileExpressionList(self):
+    def compileExpressionList(self, args):
         self.write_start('expressionList')
-        if self.tokenizer.token() != ')':
-            self.compileExpression()
-            while self.tokenizer.token() == ',':
+        for i, arg in enumerate(args):
+            if i:
                 self.writeTokenAndAdvance()
-                self.compileExpression()
+            self.compileExpression(arg)
         self.write_end('expressionList')
 
-    def compileSubroutineCall(self):
-        # subroutineName or className.subroutineName
-        self.writeTokenAndAdvance()  # identifier
-        if self.tokenizer.token() == '.':
-            self.writeTokenAndAdvance()
-            self.writeTokenAndAdvance()
-        # '('
-        self.writeTokenAndAdvance()
-        self.compileExpressionList()
+    def compileSubroutineCall(self, node):
+        # subroutineName or className.subroutineName, then '('
+        self.writeTokenAndAdvance(2 if node[2] is None else 4)
+        self.compileExpressionList(node[3])
         # ')'
         self.writeTokenAndAdvance()
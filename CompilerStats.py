@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import tracemalloc
+from SymbolTable import SymbolTable
+from VMWriter import OP_NAMES
+try:
+    import resource
+except ImportError:     # not on Windows; peak memory is then not reported
+    resource = None
+
+# --stats / --profile support shared by JackCompiler and JackAnalyzer.
+# Nothing here is imported into the hot path: the drivers only swap in
+# these helpers when a flag asks for them.
+
+class CountingSymbolTable(SymbolTable):
+    """SymbolTable that also counts every define(); used only with --stats."""
+
+    def __init__(self):
+        super().__init__()
+        self.defined = 0
+
+    def define(self, name, type_, kind, index=None):
+        self.defined += 1
+        super().define(name, type_, kind, index)
+
+
+class PhaseClock:
+    """Accumulates wall time per named phase and records peak memory.
+
+    By default the peak is the process's maximum resident set size, read
+    once at the end, so the timed phases run at full speed. With
+    trace_memory the peak is tracemalloc's instead: per file and exact, but
+    tracing slows every allocation, so the phase times are then inflated.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.phases = {}
+        self.counters = {}
+        self.opcodes = None
+        self.trace_memory = trace_memory
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        # time since the previous lap (or creation) goes to `phase`
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def result(self):
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+        else:
+            peak = maxResident()
+        return {'phases': self.phases, 'counters': self.counters, 'opcodes': self.opcodes,
+                'peak_bytes': peak, 'traced': self.trace_memory}
+
+
+def maxResident():
+    # peak resident set size of this process in bytes, or None if unknown
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def opcodeCounts(instructions):
+    counts = {}
+    for ins in instructions:
+        name = OP_NAMES[ins[0]]
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def textOpcodeCounts(text):
+    # opcodeCounts for VM text, without parsing the operands
+    counts = {}
+    for line in text.splitlines():
+        if line:
+            name = line.split(None, 1)[0]
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def formatReport(rows, opcodes=None):
+    # rows: [(file, PhaseClock.result() or None when cached)]; opcodes are
+    # the linked program's counts
+    phases = []
+    counters = []
+    traced = False
+    for _, stats in rows:
+        if stats:
+            phases += [p for p in stats['phases'] if p not in phases]
+            counters += [c for c in stats['counters'] if c not in counters]
+            traced = traced or stats['traced']
+    header = f"{'file':<24}" + ''.join(f"{p + ' ms':>15}" for p in phases)
+    header += ''.join(f"{c:>13}" for c in counters)
+    header += f"{'peak KB':>10}" if traced else f"{'max RSS KB':>12}"
+    width = 10 if traced else 12
+    lines = [header]
+    totals = {}
+    peak = None
+    for name, stats in rows:
+        name = os.path.basename(name)
+        if not stats:
+            lines.append(f"{name:<24}  (cached)")
+            continue
+        line = f"{name:<24}"
+        for p in phases:
+            t = stats['phases'].get(p, 0.0)
+            totals[p] = totals.get(p, 0) + t
+            line += f"{t * 1000:>15.2f}"
+        for c in counters:
+            n = stats['counters'].get(c, 0)
+            totals[c] = totals.get(c, 0) + n
+            line += f"{n:>13}"
+        if stats['peak_bytes'] is not None:
+            peak = max(peak or 0, stats['peak_bytes'])
+        lines.append(line + _kilobytes(stats['peak_bytes'], width))
+    line = f"{'total':<24}"
+    line += ''.join(f"{totals.get(p, 0) * 1000:>15.2f}" for p in phases)
+    line += ''.join(f"{totals.get(c, 0):>13}" for c in counters)
+    lines.append(line + _kilobytes(peak, width))
+    per_file = [(name, stats['opcodes']) for name, stats in rows if stats and stats.get('opcodes')]
+    if per_file:
+        lines += _opcodeTable(per_file, opcodes)
+    elif opcodes:
+        lines.append("VM instructions by opcode:")
+        for name, count in sorted(opcodes.items(), key=lambda item: -item[1]):
+            lines.append(f"  {name:<10}{count:>10}")
+    return '\n'.join(lines)
+
+def _kilobytes(size, width):
+    return f"{'-':>{width}}" if size is None else f"{size / 1024:>{width}.0f}"
+
+def _opcodeTable(per_file, linked):
+    # one row per compiled file, one column per opcode; the linked row is
+    # the program after the link passes, so it need not be the column sum
+    totals = {}
+    for _, counts in per_file:
+        for name, count in counts.items():
+            totals[name] = totals.get(name, 0) + count
+    order = linked or totals
+    names = sorted(set(totals) | set(order), key=lambda name: (-order.get(name, 0), name))
+    lines = ["VM instructions by opcode:",
+             f"{'file':<24}" + ''.join(f"{name:>9}" for name in names)]
+    for file, counts in per_file:
+        lines.append(f"{os.path.basename(file):<24}" + ''.join(f"{counts.get(name, 0):>9}" for name in names))
+    lines.append(f"{'total':<24}" + ''.join(f"{totals.get(name, 0):>9}" for name in names))
+    if linked:
+        lines.append(f"{'linked':<24}" + ''.join(f"{linked.get(name, 0):>9}" for name in names))
+    return lines
+
+def runProfiled(dump_path, fn, *args, **kwargs):
+    # Run fn under cProfile, dump the raw stats for snakeviz/pstats and
+    # print the hottest functions
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(fn, *args, **kwargs)
+    finally:
+        profile.dump_stats(dump_path)
+        print(f"Profile written to {dump_path}; hottest functions:")
+        pstats.Stats(profile).sort_stats('tottime').print_stats(15)
@@ -0,0 +1,251 @@
+from VMWriter import Op, CONSTANT, ARGUMENT, LOCAL, STATIC, THIS, THAT, POINTER, TEMP
+
+# Hack assembly backend. It lowers the instruction records a VMWriter holds
+# straight to .asm, so a build does not write VM text only to have a
+# separate translator parse it again.
+#
+# Compared with a textbook translation:
+#   - a push followed by a pop, a binary add/sub/and/or or an if-goto keeps
+#     the value in D instead of going through the stack
+#   - push constant 0/1 stores 0/1 directly; a pop into local/argument/
+#     this/that i walks A up from the base for small i instead of going
+#     through R13
+#   - call, return and eq/gt/lt jump to shared stubs, emitted once per
+#     program, instead of being expanded at every site
+# Labels are scoped as Function$label. Statics are named Class.i after the
+# class part of the enclosing function's name, like the interpreter's.
+
+_BASES = {LOCAL: 'LCL', ARGUMENT: 'ARG', THIS: 'THIS', THAT: 'THAT'}
+_FIXED = {TEMP: 5, POINTER: 3}
+# pops into a base segment walk A up to this index before using R13
+_WALK_LIMIT = 6
+
+_POP_D = ['@SP', 'AM=M-1', 'D=M']
+_PUSH_D = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+# top of stack op= D
+_APPLY_D = {Op.ADD: 'M=D+M', Op.SUB: 'M=M-D', Op.AND: 'M=D&M', Op.OR: 'M=D|M'}
+_UNARY = {Op.NEG: 'M=-M', Op.NOT: 'M=!M'}
+_COMPARE = {Op.EQ: '__EQ', Op.GT: '__GT', Op.LT: '__LT'}
+# the records VMWriter.writeInit emits
+_INIT = [(Op.PUSH, CONSTANT, 256), (Op.CALL, 'Sys.init', 0)]
+
+# Shared stubs. Each is entered with its return address in D.
+_STUBS = {
+    # R13 = nArgs, R14 = function address
+    '__CALL': [
+        '@SP', 'A=M', 'M=D',
+        '@LCL', 'D=M', '@SP', 'AM=M+1', 'M=D',
+        '@ARG', 'D=M', '@SP', 'AM=M+1', 'M=D',
+        '@THIS', 'D=M', '@SP', 'AM=M+1', 'M=D',
+        '@THAT', 'D=M', '@SP', 'AM=M+1', 'M=D',
+        '@SP', 'MD=M+1', '@LCL', 'M=D',
+        '@R13', 'D=D-M', '@5', 'D=D-A', '@ARG', 'M=D',
+        '@R14', 'A=M', '0;JMP',
+    ],
+    # entered by a plain jump; the return address is read from the frame
+    '__RETURN': [
+        '@5', 'D=A', '@LCL', 'A=M-D', 'D=M', '@R14', 'M=D',
+        '@SP', 'AM=M-1', 'D=M', '@ARG', 'A=M', 'M=D',
+        '@ARG', 'D=M+1', '@SP', 'M=D',
+        '@LCL', 'AM=M-1', 'D=M', '@THAT', 'M=D',
+        '@LCL', 'AM=M-1', 'D=M', '@THIS', 'M=D',
+        '@LCL', 'AM=M-1', 'D=M', '@ARG', 'M=D',
+        '@LCL', 'A=M-1', 'D=M', '@LCL', 'M=D',
+        '@R14', 'A=M', '0;JMP',
+    ],
+    # x - y is 0 exactly when x == y, even when it wraps
+    '__EQ': [
+        '@R15', 'M=D',
+        '@SP', 'AM=M-1', 'D=M', 'A=A-1', 'D=M-D',
+        '@__TRUE', 'D;JEQ', '@__FALSE', '0;JMP',
+    ],
+    # x > y is y < x
+    '__GT': [
+        '@R15', 'M=D',
+        '@SP', 'AM=M-1', 'D=M', '@R13', 'M=D',
+        '@SP', 'A=M-1', 'D=M', '@R14', 'M=D',
+        '@__LESS', '0;JMP',
+    ],
+    '__LT': [
+        '@R15', 'M=D',
+        '@SP', 'AM=M-1', 'D=M', '@R14', 'M=D',
+        '@SP', 'A=M-1', 'D=M', '@R13', 'M=D',
+        '@__LESS', '0;JMP',
+    ],
+}
+# R13 < R14 as signed 16-bit values: operands of different signs are
+# decided by the sign alone, so the subtraction cannot overflow
+_LESS = [
+    '(__LESS)',
+    '@R13', 'D=M', '@__LESS_NEG', 'D;JLT',
+    '@R14', 'D=M', '@__FALSE', 'D;JLT', '@__LESS_SUB', '0;JMP',
+    '(__LESS_NEG)',
+    '@R14', 'D=M', '@__TRUE', 'D;JGE',
+    '(__LESS_SUB)',
+    '@R14', 'D=M', '@R13', 'D=M-D', '@__TRUE', 'D;JLT',
+    '(__FALSE)',
+    '@SP', 'A=M-1', 'M=0', '@R15', 'A=M', '0;JMP',
+    '(__TRUE)',
+    '@SP', 'A=M-1', 'M=-1', '@R15', 'A=M', '0;JMP',
+]
+
+
+class HackWriter:
+    def __init__(self, output_file=None):
+        # output_file is a path, an already open text stream, or None
+        if isinstance(output_file, str):
+            self.file = open(output_file, 'w')
+        else:
+            self.file = output_file
+        self.lines = []
+        self.function = None    # name of the function being lowered
+        self.returns = 0        # return-address labels handed out
+        self.defined = set()
+        self.called = set()
+        self.stubs = set()      # shared stubs the code jumps to
+
+    def writeProgram(self, writer):
+        # lower every block of a VMWriter; the bootstrap becomes writeInit()
+        for block in writer.blocks:
+            if block and block[0][0] != Op.FUNCTION and block == _INIT:
+                self.writeInit()
+            else:
+                self.writeBlock(block)
+
+    def writeInit(self):
+        # SP = 256, call Sys.init; stop here if it ever returns
+        self.lines += ['@256', 'D=A', '@SP', 'M=D']
+        self._call('Sys.init', 0)
+        self.lines += ['(__HALT)', '@__HALT', '0;JMP']
+
+    def writeBlock(self, block):
+        out = self.lines
+        i = 0
+        while i < len(block):
+            op, a, b = block[i]
+            nxt = block[i + 1] if i + 1 < len(block) else (None, None, None)
+            if op == Op.PUSH:
+                # keep the value in D when the next instruction takes it off
+                # the stack right away
+                if nxt[0] == Op.POP:
+                    pre, post = self._store(nxt[1], nxt[2])
+                    out += pre + self._load(a, b) + post
+                    i += 2
+                    continue
+                if nxt[0] in _APPLY_D:
+                    out += self._load(a, b) + ['@SP', 'A=M-1', _APPLY_D[nxt[0]]]
+                    i += 2
+                    continue
+                if nxt[0] == Op.IF_GOTO:
+                    out += self._load(a, b) + [f"@{self._label(nxt[1])}", 'D;JNE']
+                    i += 2
+                    continue
+                if a == CONSTANT and b in (0, 1):
+                    out += ['@SP', 'AM=M+1', 'A=A-1', f"M={b}"]
+                else:
+                    out += self._load(a, b) + _PUSH_D
+            elif op == Op.POP:
+                pre, post = self._store(a, b)
+                out += pre + _POP_D + post
+            elif op in _APPLY_D:
+                out += _POP_D + ['A=A-1', _APPLY_D[op]]
+            elif op in _UNARY:
+                out += ['@SP', 'A=M-1', _UNARY[op]]
+            elif op in _COMPARE:
+                ret = self._returnLabel()
+                out += [f"@{ret}", 'D=A', f"@{_COMPARE[op]}", '0;JMP', f"({ret})"]
+                self.stubs.add(_COMPARE[op])
+            elif op == Op.LABEL:
+                out.append(f"({self._label(a)})")
+            elif op == Op.GOTO:
+                out += [f"@{self._label(a)}", '0;JMP']
+            elif op == Op.IF_GOTO:
+                out += _POP_D + [f"@{self._label(a)}", 'D;JNE']
+            elif op == Op.FUNCTION:
+                self.function = a
+                self.defined.add(a)
+                out.append(f"({a})")
+                if b:
+                    # zero the locals in one walk up the stack
+                    out += ['@SP', 'A=M', 'M=0'] + ['A=A+1', 'M=0'] * (b - 1) + ['D=A+1', '@SP', 'M=D']
+            elif op == Op.CALL:
+                self._call(a, b)
+            else:
+                out += ['@__RETURN', '0;JMP']
+                self.stubs.add('__RETURN')
+            i += 1
+
+    def _call(self, name, nArgs):
+        out = self.lines
+        if nArgs <= 1:
+            out += ['@R13', f"M={nArgs}"]
+        else:
+            out += [f"@{nArgs}", 'D=A', '@R13', 'M=D']
+        ret = self._returnLabel()
+        out += [f"@{name}", 'D=A', '@R14', 'M=D', f"@{ret}", 'D=A', '@__CALL', '0;JMP', f"({ret})"]
+        self.called.add(name)
+        self.stubs.add('__CALL')
+
+    def _label(self, label):
+        return f"{self.function}${label}" if self.function else label
+
+    def _returnLabel(self):
+        self.returns += 1
+        return f"{self.function or 'Bootstrap'}$ret.{self.returns}"
+
+    def _static(self, index):
+        return f"{(self.function or 'Bootstrap').split('.')[0]}.{index}"
+
+    def _load(self, seg, index):
+        # lines that leave the value of seg[index] in D
+        if seg == CONSTANT:
+            return [f"D={index}"] if index in (0, 1) else [f"@{index}", 'D=A']
+        if seg in _BASES:
+            base = '@' + _BASES[seg]
+            if index == 0:
+                return [base, 'A=M', 'D=M']
+            if index == 1:
+                return [base, 'A=M+1', 'D=M']
+            return [f"@{index}", 'D=A', base, 'A=D+M', 'D=M']
+        if seg == STATIC:
+            return [f"@{self._static(index)}", 'D=M']
+        return [f"@{_FIXED[seg] + index}", 'D=M']
+
+    def _store(self, seg, index):
+        # (pre, post): pre may use D, then post stores D into seg[index]
+        if seg in _BASES:
+            base = '@' + _BASES[seg]
+            if index == 0:
+                return [], [base, 'A=M', 'M=D']
+            if index <= _WALK_LIMIT:
+                return [], [base, 'A=M+1'] + ['A=A+1'] * (index - 1) + ['M=D']
+            return [f"@{index}", 'D=A', base, 'D=D+M', '@R13', 'M=D'], ['@R13', 'A=M', 'M=D']
+        if seg == STATIC:
+            return [], [f"@{self._static(index)}", 'M=D']
+        if seg == CONSTANT:
+            raise ValueError(f"pop constant in {self.function}")
+        return [], [f"@{_FIXED[seg] + index}", 'M=D']
+
+    def missing(self):
+        # functions the code calls that no lowered block defines (e.g. an OS
+        # class whose .vm was not included)
+        return sorted(self.called - self.defined)
+
+    def serialize(self):
+        lines = list(self.lines)
+        for name in ('__CALL', '__RETURN', '__EQ', '__GT', '__LT'):
+            if name in self.stubs:
+                lines.append(f"({name})")
+                lines += _STUBS[name]
+        if self.stubs & {'__EQ', '__GT', '__LT'}:
+            lines += _LESS
+        return '\n'.join(lines) + '\n'
+
+    def instructionCount(self):
+        # ROM words: every line except label declarations
+        return sum(1 for line in self.serialize().splitlines() if not line.startswith('('))
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(self.serialize())
+            self.file.close()
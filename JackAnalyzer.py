@@ -1,62 +1,92 @@
 import sys
 import os
+import argparse
 from JackTokenizer import JackTokenizer
-from CompilationEngine import CompilationEngine
+from JackParser import parseFile
+from CompilationEngine import CompilationEngine, tokenLines, writeTokens
+from SymbolTable import SymbolTable
+from VMWriter import VMWriter
+from VMCompilationEngine import VMCompilationEngine
+import CompilerStats
 
-def main(input_path):
+def main(input_path, stats=False, vm=False, one_pass=False, trace_memory=False):
+    # Each file is scanned and parsed once; the token XML, the parse XML and
+    # (with vm) the .vm output are all written from that one token stream and tree.
     if input_path.endswith(".jack"):
         jack_files = [input_path]
     else:
         jack_files = [os.path.join(input_path, f) for f in os.listdir(input_path) if f.endswith(".jack")]
 
+    file_stats = []
     for file in jack_files:
         print(f"Processing: {file}")
+        clock = CompilerStats.PhaseClock(trace_memory) if stats else None
 
-        # Generate Token XML
+        # Scan and parse once
         tokenizer = JackTokenizer(file)
+        if clock: clock.lap('tokenize')
+        tree = parseFile(tokenizer)
+        if clock: clock.lap('parse')
+
         token_output = file.replace(".jack", "T.xml")
-        with open(token_output, 'w') as out:
-            out.write("<tokens>\n")
-
-            # --- Correct XML Tag Mapping ---
-            tag_map = {
-                "KEYWORD": "keyword",
-                "SYMBOL": "symbol",
-                "IDENTIFIER": "identifier",
-                "INT_CONST": "integerConstant",
-                "STRING_CONST": "stringConstant"
-            }
-
-            while tokenizer.hasMoreTokens():
-                tokenizer.advance()
-                token = tokenizer.token()
-                token_type = tokenizer.tokenType()
-
-                xml_tag = tag_map[token_type]
-
-                clean_token = token
-                if token == '<':
-                    clean_token = '&lt;'
-                elif token == '>':
-                    clean_token = '&gt;'
-                elif token == '&':
-                    clean_token = '&amp;'
-                elif xml_tag == "stringConstant":
-                    clean_token = token.strip('"')
-
-                # Indented output for tokenizer XML
-                out.write(f"  <{xml_tag}> {clean_token} </{xml_tag}>\n")
-
-            out.write("</tokens>\n")
-
-        # Generate Parse Tree XML
-        tokenizer = JackTokenizer(file)  # Reset tokenizer
         parse_output = file.replace(".jack", ".xml")
-        compiler = CompilationEngine(tokenizer, parse_output)
-        compiler.compileClass()
+        if one_pass:
+            # Token and parse XML written together while walking the tree
+            compiler = CompilationEngine(tokenizer, parse_output, tokens_file=token_output)
+            compiler.compileClass(tree)
+            if clock: clock.lap('xml')
+        else:
+            # Generate Token XML
+            lines = tokenLines(tokenizer.stream)
+            writeTokens(tokenizer.stream, token_output, lines)
+            if clock: clock.lap('tokens xml')
+
+            # Generate Parse Tree XML
+            compiler = CompilationEngine(tokenizer, parse_output, lines=lines)
+            compiler.compileClass(tree)
+            if clock: clock.lap('parse xml')
+
+        # Same output as JackCompiler.py <file.jack>
+        if vm:
+            writer = VMWriter(file.replace(".jack", ".vm"))
+            writer.writeInit()
+            class_name = os.path.splitext(os.path.basename(file))[0]
+            VMCompilationEngine(tokenizer, SymbolTable(), writer, class_name).compileClass(tree)
+            writer.close()
+            if clock:
+                clock.lap('vm')
+                clock.opcodes = CompilerStats.opcodeCounts(writer.instructions())
+        if clock:
+            clock.counters['tokens'] = len(tokenizer.tokens)
+            file_stats.append((file, clock.result()))
+
+    if stats:
+        print("Analyzer statistics:")
+        print(CompilerStats.formatReport(file_stats))
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python JackAnalyzer.py <input_file_or_directory>")
+    parser = argparse.ArgumentParser(description="Write token and parse-tree XML for Jack classes.")
+    parser.add_argument('input', help="<input_file_or_directory>")
+    parser.add_argument('--one-pass', action='store_true',
+                        help="write T.xml and the parse XML in a single walk over the tree")
+    parser.add_argument('--vm', action='store_true',
+                        help="also write each class's .vm from the same parse")
+    parser.add_argument('--stats', action='store_true',
+                        help="report per-file phase times, token (and with --vm opcode) counts "
+                             "and the peak resident set size")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="with --stats, report per-file peak memory from tracemalloc "
+                             "(exact, but slows the timed phases)")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="run under cProfile and dump the stats to FILE")
+    args = parser.parse_args()
+    options = dict(stats=args.stats or args.trace_memory, vm=args.vm, one_pass=args.one_pass,
+                   trace_memory=args.trace_memory)
+    if args.profile:
+        CompilerStats.runProfiled(args.profile, main, args.input, **options)
     else:
-        main(sys.argv[1])
\ No newline at end of file
+        try:
+            main(args.input, **options)
+        except ValueError as e:
+            # undefined names (with --vm) and truncated sources
+            sys.exit(f"error: {e}")
\ No newline at end of file
@@ -0,0 +1,313 @@
+import os
+import re
+import time
+import glob
+import argparse
+import tempfile
+import json
+import platform
+from JackTokenizer import JackTokenizer
+from JackCompiler import compileClass, link
+from SymbolTable import SymbolTable
+from VMCompilationEngine import VMCompilationEngine
+from JackGenerator import generateProject
+from BuildCache import compilerVersion
+from VMInterpreter import VMInterpreter
+from ClassIndex import ClassIndex
+from VMWriter import VMWriter, Op, POINTER, TEMP
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def legacyTokenize(data):
+    # The original comment-stripping + char-by-char scanner, kept as the
+    # reference point for the tokenizer benchmark.
+    code = re.sub(r'//.*', '', data)
+    code = re.sub(r'/\*\*.*?\*/', '', code, flags=re.DOTALL)
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+    symbols = '{}()[].,;+-*/&|<>=~'
+    tokens = []
+    i = 0
+    while i < len(code):
+        c = code[i]
+        if c.isspace():
+            i += 1
+        elif c in symbols:
+            tokens.append(c)
+            i += 1
+        elif c == '"':
+            j = i + 1
+            while code[j] != '"':
+                j += 1
+            tokens.append(code[i:j+1])
+            i = j + 1
+        elif c.isdigit():
+            j = i
+            while j < len(code) and code[j].isdigit():
+                j += 1
+            tokens.append(code[i:j])
+            i = j
+        elif c.isalpha() or c == '_':
+            j = i
+            while j < len(code) and (code[j].isalnum() or code[j] == '_'):
+                j += 1
+            tokens.append(code[i:j])
+            i = j
+        else:
+            i += 1
+    return tokens
+
+def sampleSource(megabytes):
+    # Bundled sample classes repeated until the input reaches the requested size
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(HERE, '*', '*.jack'))):
+        with open(path) as f:
+            chunks.append(f.read())
+    unit = '\n'.join(chunks)
+    # ends in a comment with no final newline, the case the scanner must not
+    # backtrack into
+    return unit * max(1, int(megabytes * 1024 * 1024 / len(unit)) + 1) + '/* end */ // end'
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def benchTokenizer(megabytes=4, repeat=3):
+    data = sampleSource(megabytes)
+    with tempfile.NamedTemporaryFile('w', suffix='.jack', delete=False) as f:
+        f.write(data)
+    try:
+        tokenizer = JackTokenizer(f.name)
+    finally:
+        os.remove(f.name)
+    legacy_time, legacy_tokens = _best(lambda: legacyTokenize(data), repeat)
+    scan_time, tokens = _best(tokenizer.tokenize, repeat)
+    if tokens.values != legacy_tokens:
+        raise AssertionError("scanner and legacy tokenizer disagree")
+    n = len(tokens)
+    print(f"tokenizer: {len(data) / 1e6:.1f} MB, {n} tokens")
+    print(f"  legacy  {legacy_time:8.3f} s  {n / legacy_time:12,.0f} tokens/s")
+    print(f"  scanner {scan_time:8.3f} s  {n / scan_time:12,.0f} tokens/s  ({legacy_time / scan_time:.1f}x)")
+
+def linkProgram(directory, optimize=False, whole_program=False, pool_strings=False):
+    # Compile and link every class of a sample directory as JackCompiler does,
+    # without writing a file; returns the linked VMWriter
+    paths = sorted(glob.glob(os.path.join(directory, '*.jack')))
+    # records, so link() runs its passes on a writer even for a plain build
+    results = [compileClass(path, optimize=optimize, pool_strings=pool_strings, records=True)
+               for path in paths]
+    index = ClassIndex().update(paths) if whole_program else None
+    return link(None, paths, results, program=True, optimize=optimize, pool_strings=pool_strings,
+                whole_program=whole_program, index=index, log=lambda *args: None)
+
+def codeStats(writer):
+    code = list(writer.instructions())
+    os_calls = sum(1 for ins in code if ins[0] == Op.CALL and ins[1] in ('Math.multiply', 'Math.divide'))
+    return len(code), os_calls
+
+def benchCodegen(samples=('Pong', 'Square')):
+    # Emitted instruction counts and Math.multiply/divide call sites, plain vs -O
+    print(f"{'sample':<14}{'plain':>8}{'-O':>8}{'mul/div plain':>15}{'mul/div -O':>12}")
+    for name in samples:
+        plain, plain_calls = codeStats(linkProgram(os.path.join(HERE, name)))
+        opt, opt_calls = codeStats(linkProgram(os.path.join(HERE, name), optimize=True))
+        print(f"{name:<14}{plain:>8}{opt:>8}{plain_calls:>15}{opt_calls:>12}")
+
+# Headless run settings for the bundled samples: keyPressed script and
+# readInt/readLine input
+SAMPLE_RUNS = {
+    'Average': dict(inputs=[3, 10, 20, 30]),
+    'ComplexArrays': {},
+    'ConvertToBin': {},
+    'Pong': dict(keys=[(0, 3000), (140, 5)]),
+    'Seven': {},
+    'Square': dict(keys=[(0, 200), (132, 100), (0, 50), (81, 5)]),
+}
+
+# Compiler settings compared by the execute benchmark
+VARIANTS = {
+    'plain': {},
+    '-O': dict(optimize=True),
+    'whole': dict(optimize=True, whole_program=True, pool_strings=True),
+}
+
+def runProgram(writer, sample, max_steps=50_000_000):
+    # Execute linked code in the VM interpreter; returns the interpreter
+    with tempfile.NamedTemporaryFile('w', suffix='.vm', delete=False) as f:
+        f.write(writer.serialize())
+    try:
+        vm = VMInterpreter([f.name], **SAMPLE_RUNS.get(sample, {}))
+    finally:
+        os.remove(f.name)
+    vm.run(max_steps=max_steps)
+    return vm
+
+def benchExecute(samples=tuple(SAMPLE_RUNS), variants=tuple(VARIANTS)):
+    # Executed VM instructions (and the OS-cost estimate) per sample and variant
+    results = {}
+    print(f"{'sample':<14}" + ''.join(f"{v:>14}{v + ' est':>14}" for v in variants))
+    for name in samples:
+        line = f"{name:<14}"
+        for variant in variants:
+            vm = runProgram(linkProgram(os.path.join(HERE, name), **VARIANTS[variant]), name)
+            results[(name, variant)] = vm
+            line += f"{vm.steps:>14}{vm.estimatedTotal():>14}"
+        print(line)
+    return results
+
+def benchArrays(sample='ComplexArrays', variants=tuple(VARIANTS)):
+    # Executed instructions on an array-heavy sample, with how many of them
+    # set pointer 1 or go through temp 0 (the array address and store traffic)
+    print(f"{sample}")
+    print(f"{'variant':<10}{'steps':>8}{'pointer 1':>11}{'temp 0':>8}{'code':>7}")
+    results = {}
+    for variant in variants:
+        writer = linkProgram(os.path.join(HERE, sample), **VARIANTS[variant])
+        vm = runProgram(writer, sample)
+        results[variant] = vm
+        executed = list(zip(vm.program.source, vm.counts))
+        pointer = sum(n for ins, n in executed if ins[1:] == (POINTER, 1))
+        temp = sum(n for ins, n in executed if ins[1:] == (TEMP, 0))
+        print(f"{variant:<10}{vm.steps:>8}{pointer:>11}{temp:>8}{codeStats(writer)[0]:>7}")
+    return results
+
+# (classes, methods per class) for the suite's project sizes
+SUITE_SIZES = {'small': (10, 4), 'medium': (50, 8), 'large': (200, 12)}
+
+def timeProject(directory, optimize=False):
+    # Compile a project serially, timing the tokenize, parse/codegen and
+    # write phases separately. Returns a result dict.
+    paths = sorted(glob.glob(os.path.join(directory, '*.jack')))
+    out_path = os.path.join(directory, os.path.basename(os.path.normpath(directory)) + '.vm')
+    t_tokenize = t_codegen = 0.0
+    tokens = 0
+    source_bytes = 0
+    writer = VMWriter(out_path)
+    writer.writeInit()
+    for path in paths:
+        start = time.perf_counter()
+        tokenizer = JackTokenizer(path)
+        t_tokenize += time.perf_counter() - start
+        tokens += len(tokenizer.tokens)
+        source_bytes += len(tokenizer.data)
+        class_name = os.path.splitext(os.path.basename(path))[0]
+        start = time.perf_counter()
+        engine = VMCompilationEngine(tokenizer, SymbolTable(), writer, class_name, optimize=optimize)
+        engine.compileClass()
+        t_codegen += time.perf_counter() - start
+    instructions = sum(len(block) for block in writer.blocks)
+    start = time.perf_counter()
+    writer.close()
+    t_write = time.perf_counter() - start
+    total = t_tokenize + t_codegen + t_write
+    return {
+        'classes': len(paths),
+        'source_bytes': source_bytes,
+        'tokens': tokens,
+        'vm_instructions': instructions,
+        'tokenize_s': t_tokenize,
+        'codegen_s': t_codegen,
+        'write_s': t_write,
+        'total_s': total,
+        'tokens_per_s': tokens / total if total else 0.0,
+    }
+
+# Conditions that are not 0 or -1. Jack has no boolean type, and the plain
+# build's 'not; if-goto' treats only -1 as true, so every variant must too.
+CONDITIONS_SOURCE = """class Main {
+    function void main() {
+        var int x, n;
+        let x = 5;
+        let n = 3;
+        if (x & 1) { do Output.printInt(1); } else { do Output.printInt(2); }
+        if (~x) { do Output.printInt(3); } else { do Output.printInt(4); }
+        if (x) { do Output.printInt(5); }
+        if (5) { do Output.printInt(6); }
+        while (n) { do Output.printInt(n); let n = n - 1; }
+        while (5) { do Output.printInt(9); }
+        let n = -1;
+        while (n) { do Output.printInt(7); let n = 0; }
+        if (x = 5) { do Output.printInt(8); }
+        return;
+    }
+}
+"""
+
+def checkConditions(variants=tuple(VARIANTS), max_steps=100_000):
+    # Run CONDITIONS_SOURCE under every variant and compare the output with
+    # the plain build's; returns True when they all agree
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'Main.jack'), 'w') as f:
+            f.write(CONDITIONS_SOURCE)
+        for variant in ('plain',) + tuple(v for v in variants if v != 'plain'):
+            vm = runProgram(linkProgram(tmp, **VARIANTS[variant]), 'Main', max_steps)
+            outputs[variant] = ''.join(vm.os.output)
+    ok = True
+    for variant, output in outputs.items():
+        same = output == outputs['plain']
+        ok = ok and same
+        print(f"{variant:<10}{output[:40]!r:<44}{'ok' if same else 'DIFFERS from plain'}")
+    return ok
+
+def benchSuite(sizes=('small', 'medium', 'large'), repeat=3, seed=0, json_path=None):
+    # Generate each project size once, time it `repeat` times and keep the
+    # fastest run of each phase
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            classes, methods = SUITE_SIZES[size]
+            directory = os.path.join(tmp, size)
+            generateProject(directory, classes=classes, methods=methods, seed=seed)
+            runs = [timeProject(directory) for _ in range(repeat)]
+            best = dict(runs[0])
+            for key in ('tokenize_s', 'codegen_s', 'write_s', 'total_s'):
+                best[key] = min(run[key] for run in runs)
+            best['tokens_per_s'] = best['tokens'] / best['total_s']
+            best['size'] = size
+            results.append(best)
+            print(f"{size:<8} {best['classes']:>4} classes {best['tokens']:>9} tokens "
+                  f"tokenize {best['tokenize_s']:7.3f}s  codegen {best['codegen_s']:7.3f}s  "
+                  f"write {best['write_s']:7.3f}s  {best['tokens_per_s']:>10,.0f} tokens/s")
+    report = {
+        'compiler_version': compilerVersion(),
+        'python': platform.python_version(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Jack compiler benchmarks.")
+    parser.add_argument('bench', nargs='?', default='tokenizer', choices=('tokenizer', 'codegen', 'execute', 'arrays', 'conditions', 'suite'))
+    parser.add_argument('--mb', type=float, default=4, help="tokenizer input size in megabytes")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sizes', default='small,medium,large',
+                        help="suite project sizes: " + ', '.join(SUITE_SIZES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--samples', help="execute: comma-separated sample directories")
+    parser.add_argument('--variants', help="execute/arrays/conditions: comma-separated compiler variants: " + ', '.join(VARIANTS))
+    parser.add_argument('--json', help="suite: write machine-readable results to this file")
+    args = parser.parse_args()
+    if args.bench == 'tokenizer':
+        benchTokenizer(args.mb, args.repeat)
+    elif args.bench == 'codegen':
+        benchCodegen()
+    elif args.bench == 'execute':
+        benchExecute(args.samples.split(',') if args.samples else tuple(SAMPLE_RUNS),
+                     args.variants.split(',') if args.variants else tuple(VARIANTS))
+    elif args.bench == 'arrays':
+        benchArrays(variants=args.variants.split(',') if args.variants else tuple(VARIANTS))
+    elif args.bench == 'conditions':
+        if not checkConditions(args.variants.split(',') if args.variants else tuple(VARIANTS)):
+            parser.exit(1, "conditions: a variant's output differs from the plain build\n")
+    else:
+        benchSuite(args.sizes.split(','), args.repeat, args.seed, args.json)
@@ -1,33 +1,266 @@
 import sys
 import os
+import time
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from JackTokenizer import JackTokenizer
 from SymbolTable import SymbolTable
 from VMWriter import VMWriter
 from VMCompilationEngine import VMCompilationEngine
+from BuildCache import BuildCache
+import VMOptimizer
+import VMLinker
+import CompilerStats
+import SourceMap
+from ClassIndex import ClassIndex
+from HackWriter import HackWriter
 
-def main(path):
-    # Determine input .jack files and output .vm file
+# build cache directory, created next to the output .vm
+CACHE_DIR = '.jackcache'
+# class signature index inside it, used by the whole-program passes
+INDEX_FILE = 'signatures.idx'
+
+def compileClass(jack_file, optimize=False, pool_strings=False, source_map=False, stats=False,
+                 records=False, trace_memory=False):
+    # Compile a single class to (VM text, info dict), or with records to
+    # (instruction records, info dict) for builds whose link passes work on
+    # records anyway. Each class gets its own tokenizer, symbol table and
+    # engine, so this is safe to run in a worker process.
+    # With source_map, info['origins'] holds the (line, col) of every instruction;
+    # with stats, info['stats'] holds per-phase timings, counters and opcode
+    # counts (trace_memory: see PhaseClock).
+    clock = CompilerStats.PhaseClock(trace_memory) if stats else None
+    writer = VMWriter()
+    if source_map:
+        writer.trackOrigins()
+    tokenizer = JackTokenizer(jack_file)
+    if clock: clock.lap('tokenize')
+    class_name = os.path.splitext(os.path.basename(jack_file))[0]
+    symbol_table = CompilerStats.CountingSymbolTable() if stats else SymbolTable()
+    engine = VMCompilationEngine(tokenizer, symbol_table, writer, class_name,
+                                 optimize=optimize, pool_strings=pool_strings)
+    engine.compileClass()
+    if clock: clock.lap('compile')
+    fragment = list(writer.instructions()) if records else writer.serialize()
+    info = engine.stats
+    if source_map:
+        info = dict(info, origins=writer.lineTable())
+    if clock:
+        clock.lap('write')
+        clock.counters['tokens'] = len(tokenizer.tokens)
+        clock.counters['instructions'] = sum(len(block) for block in writer.blocks)
+        clock.counters['symbols'] = symbol_table.defined
+        clock.opcodes = CompilerStats.opcodeCounts(writer.instructions())
+        info = dict(info, stats=clock.result())
+    return fragment, info
+
+def bootstrap():
+    # VM text of the writeInit bootstrap
+    boot = VMWriter()
+    boot.writeInit()
+    return boot.serialize()
+
+def link(out_path, jack_files, results, program=False, optimize=False, pool_strings=False,
+         whole_program=False, inline=True, source_map=False, index=None, log=print,
+         target='vm', vm_files=()):
+    # Write the compiled (fragment, info) results of jack_files to out_path
+    # behind the bootstrap, running the link-time passes; a fragment is VM
+    # text or instruction records (see compileClass). program is True when
+    # the classes are a whole directory and index their ClassIndex. With
+    # target 'asm' the result is lowered to Hack assembly instead, together
+    # with vm_files (already translated classes such as the OS). Reports go
+    # to log. Returns the closed writer, or None when the text fragments were
+    # written out as they are.
+    if pool_strings:
+        totals = {}
+        for _, info in results:
+            for k in ('pooled_literals', 'pooled_uses', 'pool_code_saved', 'pool_bytes_saved',
+                      'pool_run_saved'):
+                totals[k] = totals.get(k, 0) + info.get(k, 0)
+        log(f"String pool ({out_path}): {totals['pooled_literals']} literals, {totals['pooled_uses']} uses")
+        log(f"  emitted code: {totals['pool_code_saved']} instructions, {totals['pool_bytes_saved']} bytes saved")
+        log(f"  per run of every use: {totals['pool_run_saved']} instructions and "
+            f"{totals['pooled_uses']} String allocations saved")
+    if (not (optimize or whole_program or source_map or vm_files) and target == 'vm'
+            and all(isinstance(fragment, str) for fragment, _ in results)):
+        # no pass rewrites the code, so nothing needs parsing: the output is
+        # the bootstrap followed by the fragments
+        with open(out_path, 'w') as f:
+            f.write(bootstrap() + ''.join(fragment for fragment, _ in results))
+        return None
+    writer = VMWriter(out_path if target == 'vm' else None)
+    if source_map:
+        writer.trackOrigins()
+    # Bootstrap: call Sys.init
+    writer.writeInit()
+    for f, (fragment, info) in zip(jack_files, results):
+        origins = None
+        if source_map:
+            name = os.path.basename(f)
+            origins = [origin and (name,) + origin for origin in info['origins']]
+        if isinstance(fragment, str):
+            writer.writeFragment(fragment, origins)
+        else:
+            writer.writeCode(fragment, origins)
+    for f in vm_files:
+        with open(f) as src:
+            writer.writeFragment(src.read())
+    if whole_program:
+        # only a directory is a whole program; a lone class can't tell what is unused
+        if program:
+            if index is not None:
+                for caller, callee, problem in VMLinker.checkCalls(writer, index):
+                    print(f"warning: {caller} calls {callee}: {problem}", file=sys.stderr)
+            if inline:
+                inlined = VMLinker.inlineAccessors(writer)
+                log(f"Inlined accessors ({out_path}):")
+                log(VMLinker.formatInlined(inlined))
+            if index is not None:
+                log(f"Void calls ({out_path}):")
+                log(VMLinker.formatVoidResults(*VMLinker.dropVoidResults(writer, index)))
+            removed = VMLinker.eliminateDeadFunctions(writer)
+            log(f"Dead functions ({out_path}):")
+            log(VMLinker.formatRemoved(removed))
+        else:
+            print("Whole-program passes need a directory; skipped", file=sys.stderr)
+    if optimize:
+        removed = VMOptimizer.optimize(writer)
+        log(f"Peephole ({out_path}):")
+        log(VMOptimizer.formatStats(removed))
+    if source_map:
+        SourceMap.writeLineMap(out_path, writer.lineTable())
+    writer.close()
+    if target == 'asm':
+        asm = HackWriter(out_path)
+        asm.writeProgram(writer)
+        for name in asm.missing():
+            print(f"warning: {name} is called but not defined; add its .vm to the directory",
+                  file=sys.stderr)
+        log(f"Hack assembly ({out_path}): {asm.instructionCount()} instructions")
+        asm.close()
+    return writer
+
+def main(path, jobs=1, use_cache=True, optimize=False, pool_strings=False, whole_program=False,
+         inline=True, source_map=False, stats=False, target='vm', trace_memory=False):
+    # Determine input .jack files and output .vm (or .asm) file
+    vm_files = []
     if os.path.isdir(path):
-        jack_files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.jack')]
-        out_path = os.path.join(path, os.path.basename(path) + '.vm')
+        # sorted so the linked output does not depend on directory order
+        jack_files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.jack'))
+        out_path = os.path.join(path, os.path.basename(os.path.normpath(path)) + '.' + target)
+        if target == 'asm':
+            # .vm files with no .jack of their own (the OS) go into the image too
+            classes = {os.path.basename(f)[:-5] for f in jack_files}
+            program = os.path.basename(os.path.normpath(path))
+            vm_files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                              if f.endswith('.vm') and f[:-3] not in classes and f[:-3] != program)
     else:
         jack_files = [path]
-        out_path = path.replace('.jack', '.vm')
+        out_path = path.replace('.jack', '.' + target)
+    # the link passes work on instruction records, so the fragments are
+    # carried as records for them and as text otherwise; either way they are
+    # never parsed again
+    records = optimize or whole_program or source_map or target != 'vm'
+    compile_options = dict(optimize=optimize, pool_strings=pool_strings, source_map=source_map,
+                           records=records)
 
-    writer = VMWriter(out_path)
-    # Bootstrap: call Sys.init
-    writer.writeInit()
-    for f in jack_files:
-        tokenizer = JackTokenizer(f)
-        class_name = os.path.splitext(os.path.basename(f))[0]
-        symbol_table = SymbolTable()
-        engine = VMCompilationEngine(tokenizer, symbol_table, writer, class_name)
-        engine.compileClass()
+    # Reuse cached fragments for classes whose source has not changed
+    results = [None] * len(jack_files)
+    keys = [None] * len(jack_files)
+    cache = None
+    if use_cache:
+        cache = BuildCache(os.path.join(os.path.dirname(out_path) or '.', CACHE_DIR),
+                           options=repr(sorted(compile_options.items())))
+        for i, f in enumerate(jack_files):
+            with open(f, 'rb') as src:
+                keys[i] = cache.key(os.path.basename(f), src.read())
+            results[i] = cache.get(keys[i])
+    todo = [i for i, result in enumerate(results) if result is None]
 
-    writer.close()
+    if jobs > 1 and len(todo) > 1:
+        # map() yields results in input order, so the output is identical to a serial run
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunk = max(1, len(todo) // (jobs * 4))
+            compiled = pool.map(partial(compileClass, stats=stats, trace_memory=trace_memory, **compile_options),
+                                [jack_files[i] for i in todo], chunksize=chunk)
+            for i, result in zip(todo, compiled):
+                results[i] = result
+    else:
+        for i in todo:
+            results[i] = compileClass(jack_files[i], stats=stats, trace_memory=trace_memory,
+                                      **compile_options)
+    if stats:
+        # timings describe this run only, so they stay out of the cache
+        file_stats = [(f, results[i][1].pop('stats', None) if i in todo else None)
+                      for i, f in enumerate(jack_files)]
+        link_start = time.perf_counter()
+    if cache is not None:
+        for i in todo:
+            cache.put(keys[i], *results[i])
+
+    index = None
+    if whole_program and os.path.isdir(path):
+        # header-only prepass; the saved index is reused for unchanged classes
+        index = ClassIndex(os.path.join(path, CACHE_DIR, INDEX_FILE) if use_cache else None)
+        index.update(jack_files)
+    writer = link(out_path, jack_files, results, program=os.path.isdir(path), optimize=optimize,
+                  pool_strings=pool_strings, whole_program=whole_program, inline=inline,
+                  source_map=source_map, index=index, target=target, vm_files=vm_files)
+    if stats:
+        link_time = time.perf_counter() - link_start
+        if writer is None:
+            # written by concatenation; count the text instead
+            opcodes = CompilerStats.textOpcodeCounts(bootstrap() + ''.join(r[0] for r in results))
+        else:
+            opcodes = CompilerStats.opcodeCounts(writer.instructions())
+        print(f"Build statistics ({out_path}):")
+        print(CompilerStats.formatReport(file_stats, opcodes))
+        print(f"link + write: {link_time * 1000:.2f} ms")
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python JackCompiler.py <file.jack|directory>")
+    parser = argparse.ArgumentParser(description="Compile Jack classes to VM code or Hack assembly.")
+    parser.add_argument('path', help="<file.jack|directory>")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes for directory builds (0 = all cores)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="recompile every class instead of reusing cached VM fragments")
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help="fold constant expressions and run the peephole optimizer")
+    parser.add_argument('--pool-strings', action='store_true',
+                        help="build each string literal once per class and reuse it")
+    parser.add_argument('--whole-program', action='store_true',
+                        help="link-time passes over the whole directory: inline accessors, "
+                             "drop unreachable functions")
+    parser.add_argument('--no-inline', action='store_true',
+                        help="with --whole-program, don't inline getter/setter methods")
+    parser.add_argument('--source-map', action='store_true',
+                        help="also write <out>.vm.map with the Jack line/column of every instruction")
+    parser.add_argument('--stats', action='store_true',
+                        help="report per-file phase times, token/instruction/symbol/opcode counts "
+                             "and the peak resident set size")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="with --stats, report per-file peak memory from tracemalloc "
+                             "(exact, but slows the timed phases)")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="run under cProfile (single process) and dump the stats to FILE")
+    parser.add_argument('--target', choices=('vm', 'asm'), default='vm',
+                        help="asm: write Hack assembly directly instead of VM code")
+    args = parser.parse_args()
+    if args.target == 'asm' and args.source_map:
+        parser.error("--source-map maps VM instructions; it needs --target vm")
+    options = dict(jobs=args.jobs or os.cpu_count() or 1, use_cache=not args.no_cache,
+                   optimize=args.optimize, pool_strings=args.pool_strings,
+                   whole_program=args.whole_program, inline=not args.no_inline,
+                   source_map=args.source_map, stats=args.stats or args.trace_memory,
+                   target=args.target, trace_memory=args.trace_memory)
+    if args.profile:
+        # worker processes would escape the profiler
+        options['jobs'] = 1
+        CompilerStats.runProfiled(args.profile, main, args.path, **options)
     else:
-        main(sys.argv[1])
\ No newline at end of file
+        try:
+            main(args.path, **options)
+        except ValueError as e:
+            # undefined names and truncated sources
+            sys.exit(f"error: {e}")
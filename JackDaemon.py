@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import socket
+import argparse
+import tempfile
+import selectors
+from JackCompiler import compileClass, link
+from ClassIndex import ClassIndex
+from VMWriter import VMWriter
+import VMOptimizer
+import SourceMap
+
+# Long-running compiler for editor integration. It watches project
+# directories by polling mtimes and keeps every class's compiled fragment in
+# memory. When a class changes, it recompiles only that class and relinks
+# the directory .vm.
+#
+# Clients talk to it over a Unix socket: one command line in, one JSON line out.
+#   build <dir>    pick up changes now; reply with what was recompiled
+#   vm <dir>       the same, plus the linked VM text
+#   status         watched projects
+#   stop           shut the daemon down
+# With a single watched project, <dir> may be left out.
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"jackd-{os.getuid()}.sock")
+
+class Project:
+    """One watched directory: compiled classes and the linked output."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.out_path = os.path.join(directory, os.path.basename(os.path.normpath(directory)) + '.vm')
+        self.classes = {}       # .jack path -> (stamp, text, info)
+        self.errors = {}        # .jack path -> (stamp, message) of its last failed compile
+        self.text = None        # linked VM text, when it was built in memory
+        self.index = ClassIndex()  # signatures for the whole-program passes
+        self.builds = 0
+
+
+class JackDaemon:
+    def __init__(self, directories, optimize=False, pool_strings=False, whole_program=False,
+                 inline=True, source_map=False, interval=0.25, log=print):
+        self.projects = {os.path.abspath(d): Project(d) for d in directories}
+        self.optimize = optimize
+        self.pool_strings = pool_strings
+        self.whole_program = whole_program
+        self.inline = inline
+        self.source_map = source_map
+        self.interval = interval
+        self.log = log
+        self.running = False
+        boot = VMWriter()
+        boot.writeInit()
+        self.bootstrap = boot.serialize()
+        self.bootstrap_size = sum(len(block) for block in boot.blocks)
+
+    def compile(self, path):
+        # (fragment, info): VM text, or instruction records for link() when
+        # whole-program passes run at every relink
+        fragment, info = compileClass(path, optimize=self.optimize, pool_strings=self.pool_strings,
+                                      source_map=self.source_map,
+                                      records=self.optimize or self.whole_program)
+        if self.optimize and not self.whole_program:
+            # the peephole passes are per function, so a class can be optimized
+            # on its own and the directory relinked by concatenation
+            writer = VMWriter()
+            if self.source_map:
+                writer.trackOrigins()
+            writer.writeCode(fragment, info.get('origins'))
+            VMOptimizer.optimize(writer)
+            fragment = writer.serialize()
+            if self.source_map:
+                info = dict(info, origins=writer.lineTable())
+        return fragment, info
+
+    def refresh(self, project):
+        # Recompile the classes whose .jack changed since the last look and
+        # relink if anything did. Returns (recompiled paths, paths that failed).
+        stamps = {}
+        for entry in os.scandir(project.directory):
+            if entry.name.endswith('.jack'):
+                st = entry.stat()
+                stamps[entry.path] = (st.st_mtime_ns, st.st_size)
+        changed = sorted(path for path, stamp in stamps.items()
+                         if project.classes.get(path, (None,))[0] != stamp
+                         and project.errors.get(path, (None,))[0] != stamp)
+        removed = [path for path in project.classes if path not in stamps]
+        for path in removed:
+            del project.classes[path]
+        for path in list(project.errors):
+            if path not in stamps:
+                del project.errors[path]
+        recompiled = []
+        failed = []
+        for path in changed:
+            try:
+                project.classes[path] = (stamps[path],) + self.compile(path)
+            except Exception as e:
+                # keep serving the last good fragment
+                project.errors[path] = (stamps[path], f"{type(e).__name__}: {e}")
+                failed.append(path)
+                continue
+            project.errors.pop(path, None)
+            recompiled.append(path)
+        if recompiled or removed:
+            self.relink(project)
+        return recompiled, failed
+
+    def relink(self, project):
+        files = sorted(project.classes)
+        results = [project.classes[path][1:] for path in files]
+        if self.whole_program:
+            link(project.out_path, files, results, program=True, optimize=self.optimize,
+                 whole_program=True, inline=self.inline, source_map=self.source_map,
+                 index=project.index.update(files), log=lambda *args: None)
+            project.text = None
+        else:
+            # every fragment is final: the linked file is the bootstrap plus the
+            # fragments in class order
+            project.text = self.bootstrap + ''.join(text for text, _ in results)
+            tmp = f"{project.out_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                f.write(project.text)
+            os.replace(tmp, project.out_path)
+            if self.source_map:
+                table = [None] * self.bootstrap_size
+                for path, (_, info) in zip(files, results):
+                    name = os.path.basename(path)
+                    table += [origin and (name,) + origin for origin in info['origins']]
+                SourceMap.writeLineMap(project.out_path, table)
+        project.builds += 1
+
+    def linkedText(self, project):
+        if project.text is None:
+            with open(project.out_path) as f:
+                project.text = f.read()
+        return project.text
+
+    def handle(self, line):
+        # one client command -> reply dict
+        cmd, _, arg = line.strip().partition(' ')
+        if cmd in ('build', 'vm'):
+            if arg:
+                project = self.projects.get(os.path.abspath(arg))
+            elif len(self.projects) == 1:
+                project = next(iter(self.projects.values()))
+            else:
+                project = None
+            if project is None:
+                return {'ok': False, 'error': f"not watching {arg or '(no directory given)'}"}
+            start = time.perf_counter()
+            recompiled, _ = self.refresh(project)
+            reply = {'ok': not project.errors, 'output': project.out_path,
+                     'recompiled': [os.path.basename(path) for path in recompiled],
+                     'errors': {os.path.basename(path): message
+                                for path, (_, message) in project.errors.items()},
+                     'ms': round((time.perf_counter() - start) * 1000, 3)}
+            if cmd == 'vm':
+                reply['vm'] = self.linkedText(project)
+            return reply
+        if cmd == 'status':
+            return {'ok': True, 'projects': {
+                p.directory: {'classes': len(p.classes), 'builds': p.builds, 'errors': len(p.errors)}
+                for p in self.projects.values()}}
+        if cmd == 'stop':
+            self.running = False
+            return {'ok': True}
+        return {'ok': False, 'error': f"unknown command {cmd!r}"}
+
+    def pollAll(self):
+        for project in self.projects.values():
+            start = time.perf_counter()
+            recompiled, failed = self.refresh(project)
+            if recompiled:
+                names = (', '.join(os.path.basename(path) for path in recompiled)
+                         if len(recompiled) <= 5 else f"{len(recompiled)} classes")
+                self.log(f"{project.out_path}: recompiled {names} "
+                         f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+            for path in failed:
+                self.log(f"{path}: {project.errors[path][1]}")
+
+    def serve(self, socket_path=DEFAULT_SOCKET):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen()
+        server.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+        self.running = True
+        self.pollAll()
+        self.log(f"Watching {len(self.projects)} project(s) on {socket_path}")
+        try:
+            while self.running:
+                for _ in selector.select(self.interval):
+                    try:
+                        conn, _ = server.accept()
+                    except BlockingIOError:
+                        continue
+                    with conn:
+                        # one request per connection; a stuck client can't hang the daemon
+                        conn.settimeout(1.0)
+                        try:
+                            with conn.makefile('rw') as stream:
+                                reply = self.handle(stream.readline())
+                                stream.write(json.dumps(reply) + '\n')
+                        except OSError:
+                            pass
+                if self.running:
+                    self.pollAll()
+        finally:
+            selector.close()
+            server.close()
+            os.unlink(socket_path)
+
+def query(command, socket_path=DEFAULT_SOCKET, timeout=5.0):
+    # send one command to a running daemon and return its reply
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        with conn.makefile('rw') as stream:
+            stream.write(command + '\n')
+            stream.flush()
+            return json.loads(stream.readline())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Watch Jack projects and keep their .vm up to date.")
+    parser.add_argument('dirs', nargs='*', help="project directories to watch")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket to serve (or query)")
+    parser.add_argument('--query', metavar='COMMAND',
+                        help="send COMMAND (build/vm <dir>, status, stop) to a running daemon and print the reply")
+    parser.add_argument('--interval', type=float, default=0.25, help="seconds between mtime polls")
+    parser.add_argument('-O', '--optimize', action='store_true')
+    parser.add_argument('--pool-strings', action='store_true')
+    parser.add_argument('--whole-program', action='store_true')
+    parser.add_argument('--no-inline', action='store_true')
+    parser.add_argument('--source-map', action='store_true')
+    args = parser.parse_args()
+    if args.query:
+        print(json.dumps(query(args.query, args.socket), indent=2))
+    elif not args.dirs:
+        parser.error("no project directories to watch")
+    else:
+        daemon = JackDaemon(args.dirs, optimize=args.optimize, pool_strings=args.pool_strings,
+                            whole_program=args.whole_program, inline=not args.no_inline,
+                            source_map=args.source_map, interval=args.interval,
+                            log=lambda message: print(message, flush=True))
+        try:
+            daemon.serve(args.socket)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,145 @@
+import os
+import random
+import argparse
+
+# Deterministic generator of large synthetic Jack projects for benchmarking.
+# The same (classes, methods, seed) always produces byte-identical sources.
+# Generated programs compile and run: loops are bounded and nothing divides
+# by a value that can be zero.
+
+_OPS = ('+', '-', '&', '|', '<', '>', '=', '*')
+_WORDS = ('score', 'level', 'paddle', 'ball', 'wall', 'frame', 'player', 'speed',
+          'bonus', 'lives', 'game', 'over', 'press', 'key', 'to', 'start')
+
+class _ClassWriter:
+    def __init__(self, rng, name, index, classes, methods, fields, depth):
+        self.rng = rng
+        self.name = name
+        self.index = index
+        self.classes = classes
+        self.methods = methods
+        self.fields = fields
+        self.depth = depth
+        self.lines = []
+
+    def emit(self, line, indent=0):
+        self.lines.append('    ' * indent + line)
+
+    def expression(self, names, depth):
+        # left-deep chains with parenthesized subexpressions, depth levels deep
+        rng = self.rng
+        if depth <= 0 or rng.random() < 0.2:
+            choice = rng.random()
+            if choice < 0.5:
+                return rng.choice(names)
+            if choice < 0.8:
+                return str(rng.randint(0, 999))
+            return f"-{rng.choice(names)}"
+        parts = [self.expression(names, depth - 1)]
+        for _ in range(rng.randint(1, 3)):
+            op = rng.choice(_OPS)
+            operand = self.expression(names, depth - 1)
+            parts.append(f"{op} ({operand})" if not operand.isalnum() else f"{op} {operand}")
+        return ' '.join(parts)
+
+    def literal(self):
+        rng = self.rng
+        return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(4, 40)))
+
+    def method(self, m):
+        rng = self.rng
+        names = ['x', 'y', 'a', 'b', 'i'] + [f"f{k}" for k in range(self.fields)]
+        self.emit(f"/** Generated method {m} of {self.name}. */", 1)
+        self.emit(f"method int m{m}(int x, int y) {{", 1)
+        self.emit("var int a, b, i;", 2)
+        self.emit("var Array arr;", 2)
+        self.emit("let arr = Array.new(8);", 2)
+        self.emit(f"let a = {self.expression(names[:2], self.depth)};", 2)
+        self.emit("let i = 0;", 2)
+        self.emit("while (i < 8) {", 2)
+        self.emit(f"let arr[i] = {self.expression(names, self.depth)};", 3)
+        self.emit("let arr[i] = arr[i] + 1;", 3)
+        self.emit("let i = i + 1;", 3)
+        self.emit("}", 2)
+        for _ in range(rng.randint(2, 6)):
+            field = rng.randrange(self.fields)
+            self.emit(f"if ({self.expression(names, 2)} > {rng.randint(0, 99)}) {{", 2)
+            self.emit(f"let f{field} = {self.expression(names, self.depth)};", 3)
+            self.emit("} else {", 2)
+            self.emit(f"let b = {self.expression(names, self.depth)};", 3)
+            self.emit("}", 2)
+        if rng.random() < 0.5:
+            self.emit(f'do Output.printString("{self.literal()}");', 2)
+        if self.index + 1 < self.classes:
+            self.emit(f"let b = Cls{self.index + 1}.helper(a, b);", 2)
+        if m > 0:
+            self.emit(f"let b = b + m{m - 1}(a, y);", 2)
+        self.emit("do arr.dispose();", 2)
+        self.emit(f"return {self.expression(['a', 'b', 'i'], self.depth)};", 2)
+        self.emit("}", 1)
+        self.emit("")
+
+    def write(self):
+        self.emit(f"// Generated class {self.index}")
+        self.emit(f"class {self.name} {{")
+        self.emit(f"field int {', '.join(f'f{k}' for k in range(self.fields))};", 1)
+        self.emit("static int count;", 1)
+        self.emit("")
+        self.emit(f"constructor {self.name} new(int seed) {{", 1)
+        for k in range(self.fields):
+            self.emit(f"let f{k} = seed + {k};", 2)
+        self.emit("let count = count + 1;", 2)
+        self.emit("return this;", 2)
+        self.emit("}", 1)
+        self.emit("")
+        self.emit("function int helper(int p, int q) {", 1)
+        self.emit("return (p & 255) + (q | 1);", 2)
+        self.emit("}", 1)
+        self.emit("")
+        for m in range(self.methods):
+            self.method(m)
+        self.emit("method void dispose() {", 1)
+        self.emit("do Memory.deAlloc(this);", 2)
+        self.emit("return;", 2)
+        self.emit("}", 1)
+        self.emit("}")
+        return '\n'.join(self.lines) + '\n'
+
+def generateProject(out_dir, classes=50, methods=8, fields=4, depth=3, seed=0):
+    # Write Main.jack plus Cls0..Cls{classes-1}.jack into out_dir.
+    # Returns the list of written paths.
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(classes):
+        name = f"Cls{i}"
+        source = _ClassWriter(rng, name, i, classes, methods, fields, depth).write()
+        path = os.path.join(out_dir, name + '.jack')
+        with open(path, 'w') as f:
+            f.write(source)
+        paths.append(path)
+    main = ["class Main {", "    function void main() {", "        var int total;"]
+    for i in range(classes):
+        main.append(f"        var Cls{i} c{i};")
+    for i in range(classes):
+        main.append(f"        let c{i} = Cls{i}.new({i});")
+        main.append(f"        let total = total + c{i}.m{methods - 1}({i}, total);")
+        main.append(f"        do c{i}.dispose();")
+    main += ["        do Output.printInt(total);", "        return;", "    }", "}"]
+    path = os.path.join(out_dir, 'Main.jack')
+    with open(path, 'w') as f:
+        f.write('\n'.join(main) + '\n')
+    paths.append(path)
+    return paths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic Jack project.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--classes', type=int, default=50)
+    parser.add_argument('--methods', type=int, default=8)
+    parser.add_argument('--fields', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=3, help="expression nesting depth")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = generateProject(args.out_dir, args.classes, args.methods, args.fields, args.depth, args.seed)
+    print(f"Wrote {len(paths)} classes to {args.out_dir}")
@@ -0,0 +1,199 @@
+from JackTokenizer import INT_CONST, STRING_CONST
+
+# Recursive-descent parser for Jack. One pass over a TokenStream builds the
+# tree that both the XML writer (CompilationEngine) and the VM code
+# generator (VMCompilationEngine) walk, so a file is scanned and parsed once.
+#
+# Declarations and statements are tuples; pos is the stream index of their
+# first token (see TokenStream.position):
+#   ('class', pos, name, [classVarDec], [subroutine])
+#   classVarDec  (kind, type, [names])
+#   ('subroutine', pos, kind, returnType, name, [(type, name)], [(type, [names])], statements)
+#   ('let', pos, name, index expr | None, expr)
+#   ('if', pos, cond, statements, else statements | None)
+#   ('while', pos, cond, statements)
+#   ('do', pos, call)
+#   ('return', pos, expr | None)
+# Expressions:
+#   ('int', value) ('str', s) ('keyword', kw) ('var', name) ('paren', expr)
+#   ('index', name, expr) ('call', name, sub|None, [args])
+#   ('unary', op, term) ('binary', op, left, right)
+# Like the engines it replaces, the parser trusts the input to be valid Jack.
+
+_BINARY_OPS = frozenset(('+', '-', '*', '/', '&', '|', '<', '>', '='))
+_KEYWORD_CONSTANTS = frozenset(('true', 'false', 'null', 'this'))
+
+class JackParser:
+    def __init__(self, stream):
+        self.values = stream.values
+        self.kinds = stream.kinds
+        self.i = 0
+
+    def parseClass(self):
+        try:
+            return self._class()
+        except IndexError:
+            raise ValueError("unexpected end of input") from None
+
+    def _class(self):
+        v = self.values
+        pos = self.i
+        name = v[pos + 1]
+        self.i = pos + 3                  # 'class' name '{'
+        class_vars = []
+        while v[self.i] in ('static', 'field'):
+            kind, type_ = v[self.i], v[self.i + 1]
+            self.i += 2
+            class_vars.append((kind, type_, self._names()))
+        subroutines = []
+        while v[self.i] in ('constructor', 'function', 'method'):
+            subroutines.append(self._subroutine())
+        self.i += 1                       # '}'
+        return ('class', pos, name, class_vars, subroutines)
+
+    def _names(self):
+        # varName (',' varName)* ';'
+        v = self.values
+        names = [v[self.i]]
+        self.i += 1
+        while v[self.i] == ',':
+            names.append(v[self.i + 1])
+            self.i += 2
+        self.i += 1
+        return names
+
+    def _subroutine(self):
+        v = self.values
+        pos = self.i
+        kind, return_type, name = v[pos], v[pos + 1], v[pos + 2]
+        self.i = pos + 4                  # past '('
+        params = []
+        if v[self.i] != ')':
+            params.append((v[self.i], v[self.i + 1]))
+            self.i += 2
+            while v[self.i] == ',':
+                params.append((v[self.i + 1], v[self.i + 2]))
+                self.i += 3
+        self.i += 2                       # ')' '{'
+        local_vars = []
+        while v[self.i] == 'var':
+            type_ = v[self.i + 1]
+            self.i += 2
+            local_vars.append((type_, self._names()))
+        body = self._statements()
+        self.i += 1                       # '}'
+        return ('subroutine', pos, kind, return_type, name, params, local_vars, body)
+
+    def _statements(self):
+        v = self.values
+        statements = []
+        while True:
+            pos = self.i
+            token = v[pos]
+            if token == 'let':
+                name = v[pos + 1]
+                self.i = pos + 2
+                index = None
+                if v[self.i] == '[':
+                    self.i += 1
+                    index = self._expression()
+                    self.i += 1           # ']'
+                self.i += 1               # '='
+                statements.append(('let', pos, name, index, self._expression()))
+                self.i += 1               # ';'
+            elif token == 'if':
+                self.i = pos + 2
+                cond = self._expression()
+                self.i += 2               # ')' '{'
+                then = self._statements()
+                self.i += 1               # '}'
+                otherwise = None
+                if v[self.i] == 'else':
+                    self.i += 2
+                    otherwise = self._statements()
+                    self.i += 1
+                statements.append(('if', pos, cond, then, otherwise))
+            elif token == 'while':
+                self.i = pos + 2
+                cond = self._expression()
+                self.i += 2
+                body = self._statements()
+                self.i += 1
+                statements.append(('while', pos, cond, body))
+            elif token == 'do':
+                self.i = pos + 1
+                statements.append(('do', pos, self._call()))
+                self.i += 1               # ';'
+            elif token == 'return':
+                self.i = pos + 1
+                value = None if v[self.i] == ';' else self._expression()
+                self.i += 1
+                statements.append(('return', pos, value))
+            else:
+                return statements
+
+    def _expression(self):
+        v = self.values
+        node = self._term()
+        while v[self.i] in _BINARY_OPS:
+            op = v[self.i]
+            self.i += 1
+            node = ('binary', op, node, self._term())
+        return node
+
+    def _term(self):
+        v = self.values
+        i = self.i
+        token = v[i]
+        kind = self.kinds[i]
+        if kind == INT_CONST:
+            self.i = i + 1
+            return ('int', int(token))
+        if kind == STRING_CONST:
+            self.i = i + 1
+            return ('str', token.strip('"'))
+        if token in _KEYWORD_CONSTANTS:
+            self.i = i + 1
+            return ('keyword', token)
+        if token == '(':
+            self.i = i + 1
+            node = self._expression()
+            self.i += 1
+            return ('paren', node)
+        if token == '-' or token == '~':
+            self.i = i + 1
+            return ('unary', token, self._term())
+        nxt = v[i + 1]
+        if nxt == '[':
+            self.i = i + 2
+            index = self._expression()
+            self.i += 1
+            return ('index', token, index)
+        if nxt == '.' or nxt == '(':
+            return self._call()
+        self.i = i + 1
+        return ('var', token)
+
+    def _call(self):
+        # subroutineName '(' args ')' | name '.' subroutineName '(' args ')'
+        v = self.values
+        name = v[self.i]
+        sub = None
+        if v[self.i + 1] == '.':
+            sub = v[self.i + 2]
+            self.i += 4
+        else:
+            self.i += 2
+        args = []
+        if v[self.i] != ')':
+            args.append(self._expression())
+            while v[self.i] == ',':
+                self.i += 1
+                args.append(self._expression())
+        self.i += 1                       # ')'
+        return ('call', name, sub, args)
+
+
+def parseFile(tokenizer):
+    # AST for the class in an already scanned JackTokenizer
+    return JackParser(tokenizer.stream).parseClass()
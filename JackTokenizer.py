@@ -1,56 +1,98 @@
 import re
+import sys
+from array import array
+from bisect import bisect_right
+
+KEYWORDS = frozenset({"class", "constructor", "function", "method", "field", "static", "var",
+                      "int", "char", "boolean", "void", "true", "false", "null", "this",
+                      "let", "do", "if", "else", "while", "return"})
+
+# Token kind codes stored in the token stream, and their tokenType() names
+KEYWORD, SYMBOL, INT_CONST, STRING_CONST, IDENTIFIER = range(5)
+TYPE_NAMES = ("KEYWORD", "SYMBOL", "INT_CONST", "STRING_CONST", "IDENTIFIER")
+
+# Master scanner. Each match swallows the whitespace and comments in front
+# of a token, then exactly one of the token groups matches; 'word' is a
+# keyword or identifier (decided by lookup), 'error' an unknown char. 'end'
+# takes trailing whitespace and comments, so at the end of input the scanner
+# never backtracks into a comment to find a token.
+_TOKEN_RE = re.compile(r"""
+    \s*(?:(?://[^\n]*|/\*.*?\*/)\s*)*
+    (?:
+      (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<SYMBOL>[{}()\[\].,;+\-*/&|<>=~])
+    | (?P<INT_CONST>[0-9]+)
+    | (?P<STRING_CONST>"[^"\n]*")
+    | (?P<error>.)
+    | (?P<end>\Z)
+    )
+""", re.VERBOSE | re.DOTALL)
+_WORD, _ERROR, _END = 1, 5, 6
+# token kind for each group number (m.lastindex)
+_GROUP_KINDS = (None, None, SYMBOL, INT_CONST, STRING_CONST, None, None)
+
+class TokenStream:
+    """Pre-classified tokens: interned values plus parallel kind and offset arrays."""
+    __slots__ = ('values', 'kinds', 'offsets', '_newlines')
+
+    def __init__(self):
+        self.values = []
+        self.kinds = array('B')
+        self.offsets = array('I')   # source offset of each token
+        self._newlines = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def position(self, data, i):
+        # (line, column) of token i, both 1-based; the newline index is built on first use
+        if self._newlines is None:
+            self._newlines = array('I', (m.start() for m in re.finditer('\n', data)))
+        offset = self.offsets[i]
+        line = bisect_right(self._newlines, offset)
+        line_start = self._newlines[line - 1] + 1 if line else 0
+        return line + 1, offset - line_start + 1
+
 
 class JackTokenizer:
     def __init__(self, input_file):
+        self.filename = input_file
         with open(input_file, 'r') as f:
             self.data = f.read()
 
-        self.tokens = self.tokenize()
+        self.stream = self.tokenize()
+        self.tokens = self.stream.values
         # print(f"DEBUG: Total tokens = {len(self.tokens)}")
         self.current_index = -1
         self.current_token = None
 
 
     def tokenize(self):
-        # Remove all comments (single-line, multi-line, doc)
-        code = re.sub(r'//.*', '', self.data)
-        code = re.sub(r'/\*\*.*?\*/', '', code, flags=re.DOTALL)
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-
-        symbols = '{}()[].,;+-*/&|<>=~'
-        tokens = []
-        i = 0
-        while i < len(code):
-            c = code[i]
-
-            if c.isspace():
-                i += 1
-                continue
-            elif c in symbols:
-                tokens.append(c)
-                i += 1
-            elif c == '"':
-                j = i + 1
-                while code[j] != '"':
-                    j += 1
-                tokens.append(code[i:j+1])
-                i = j + 1
-            elif c.isdigit():
-                j = i
-                while j < len(code) and code[j].isdigit():
-                    j += 1
-                tokens.append(code[i:j])
-                i = j
-            elif c.isalpha() or c == '_':
-                j = i
-                while j < len(code) and (code[j].isalnum() or code[j] == '_'):
-                    j += 1
-                tokens.append(code[i:j])
-                i = j
+        # One left-to-right pass over the source. Whitespace and comments are
+        # matched by the same regex as the tokens, so a '//' or '/*' inside a
+        # string literal is never mistaken for a comment.
+        stream = TokenStream()
+        add_value = stream.values.append
+        add_kind = stream.kinds.append
+        add_offset = stream.offsets.append
+        words = {}  # word -> (interned word, kind)
+        for m in _TOKEN_RE.finditer(self.data):
+            group = m.lastindex
+            if group == _WORD:
+                token = m.group(group)
+                word = words.get(token)
+                if word is None:
+                    token = sys.intern(token)
+                    word = words[token] = (token, KEYWORD if token in KEYWORDS else IDENTIFIER)
+                add_value(word[0])
+                add_kind(word[1])
+            elif group >= _ERROR:
+                continue  # unknown chars (shouldn't happen) and the end of input
             else:
-                i += 1  # Skip unknown chars (shouldn't happen)
-
-        return tokens
+                add_value(m.group(group))
+                add_kind(_GROUP_KINDS[group])
+            add_offset(m.start(group))
+        return stream
 
 
     def hasMoreTokens(self):
@@ -64,25 +106,10 @@ class JackTokenizer:
             self.current_token = None
 
     def tokenType(self):
-        token = self.current_token
-        if token is None:
+        if self.current_token is None:
             raise ValueError("No current token. Did you forget to call advance()?")
-
-        keywords = {"class", "constructor", "function", "method", "field", "static", "var",
-                    "int", "char", "boolean", "void", "true", "false", "null", "this",
-                    "let", "do", "if", "else", "while", "return"}
-        symbols = "{}()[].,;+-*/&|<>=~"
-
-        if token in keywords:
-            return "KEYWORD"
-        elif token in symbols:
-            return "SYMBOL"
-        elif token.isdigit():
-            return "INT_CONST"
-        elif token.startswith('"'):
-            return "STRING_CONST"
-        else:
-            return "IDENTIFIER"
+        # classified once at scan time
+        return TYPE_NAMES[self.stream.kinds[self.current_index]]
 
     def token(self):
         return self.current_token
@@ -0,0 +1,145 @@
+# Local slot packing for -O. Jack declares every local at the top of a
+# subroutine, so each one normally gets its own slot for the whole call, and
+# the 'function f n' prologue pushes a zero for every slot. Here the body
+# (a JackParser statement list) is walked once in source order to find the
+# span over which each local is live. Locals whose spans do not overlap
+# share a slot.
+#
+# A statement is numbered p. It reads at point 2p, and a let assigns at 2p+1,
+# so `let b = a + 1` can put b in the slot a dies in. Spans are conservative:
+#   - a local read in a loop before the iteration assigns it carries a value
+#     around the back edge, so it is live for the whole loop
+#   - a local that may be read before any assignment relies on the
+#     prologue's zero, so it gets a slot no earlier local has used
+# A local that is never mentioned gets no slot.
+
+def packLocals(statements, names):
+    # ({local: slot}, number of slots) for the locals in names
+    names = set(names)
+    spans = _Spans(names)
+    spans.walk(statements)
+    first, last = spans.first, spans.last
+    for start, end, exposed in spans.loops:
+        for name in exposed & names:
+            first[name] = min(first[name], start)
+            last[name] = max(last[name], end)
+    zeroed = set()
+    _flow(statements, set(), zeroed)
+    slots = {}
+    count = 0
+    free = []               # slots whose local is dead
+    active = []             # (last point, slot) of live locals
+    for name in sorted(first, key=lambda n: (first[n], last[n], n)):
+        start = first[name]
+        for entry in [entry for entry in active if entry[0] < start]:
+            active.remove(entry)
+            free.append(entry[1])
+        if free and name not in zeroed:
+            slot = min(free)
+            free.remove(slot)
+        else:
+            slot = count
+            count += 1
+        slots[name] = slot
+        active.append((last[name], slot))
+    return slots, count
+
+
+class _Spans:
+    """First and last point at which each local is mentioned, plus the loops."""
+
+    def __init__(self, names):
+        self.names = names
+        self.point = 0
+        self.first = {}
+        self.last = {}
+        self.loops = []     # (start, end, locals exposed at the loop head)
+
+    def mention(self, name, at):
+        if name in self.names:
+            self.first.setdefault(name, at)
+            self.last[name] = at
+
+    def read(self, node):
+        at = 2 * self.point
+        for name in _reads(node):
+            self.mention(name, at)
+
+    def walk(self, statements):
+        for node in statements:
+            self.point += 1
+            kind = node[0]
+            if kind == 'let':
+                _, _, name, index, value = node
+                if index is not None:
+                    self.read(index)
+                    self.mention(name, 2 * self.point)
+                self.read(value)
+                if index is None:
+                    self.mention(name, 2 * self.point + 1)
+            elif kind == 'if':
+                self.read(node[2])
+                self.walk(node[3])
+                if node[4] is not None:
+                    self.walk(node[4])
+            elif kind == 'while':
+                start = 2 * self.point
+                self.read(node[2])
+                self.walk(node[3])
+                exposed = set(_reads(node[2]))
+                _flow(node[3], set(), exposed)
+                self.loops.append((start, 2 * self.point + 1, exposed))
+            elif kind == 'do':
+                self.read(node[2])
+            elif node[2] is not None:
+                self.read(node[2])
+
+
+def _flow(statements, assigned, exposed):
+    # Add to exposed every name read while it is not in assigned (the names
+    # certainly assigned by then). Returns assigned after the statements.
+    for node in statements:
+        kind = node[0]
+        if kind == 'let':
+            _, _, name, index, value = node
+            reads = set(_reads(value))
+            if index is not None:
+                reads.update(_reads(index))
+                reads.add(name)
+            exposed |= reads - assigned
+            if index is None:
+                assigned = assigned | {name}
+        elif kind == 'if':
+            exposed |= set(_reads(node[2])) - assigned
+            then = _flow(node[3], assigned, exposed)
+            otherwise = _flow(node[4], assigned, exposed) if node[4] is not None else assigned
+            assigned = then & otherwise
+        elif kind == 'while':
+            # the body may run zero times, and its first run sees only what
+            # was assigned before the loop
+            exposed |= set(_reads(node[2])) - assigned
+            _flow(node[3], assigned, exposed)
+        elif node[2] is not None:
+            exposed |= set(_reads(node[2])) - assigned
+    return assigned
+
+def _reads(node):
+    # names of the variables an expression reads
+    kind = node[0]
+    if kind == 'var':
+        yield node[1]
+    elif kind == 'index':
+        yield node[1]
+        yield from _reads(node[2])
+    elif kind == 'call':
+        if node[2] is not None:
+            yield node[1]
+        for arg in node[3]:
+            yield from _reads(arg)
+    elif kind == 'paren':
+        yield from _reads(node[1])
+    elif kind == 'unary':
+        yield from _reads(node[2])
+    elif kind == 'binary':
+        yield from _reads(node[2])
+        yield from _reads(node[3])
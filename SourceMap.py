@@ -0,0 +1,69 @@
+import os
+
+# .vm.map side files: the Jack source position of every VM instruction in a
+# .vm file, so run-time counts can be charged to source lines.
+#
+# The table is run-length encoded over instruction indices (labels and the
+# bootstrap count as instructions too). After the header each line is
+#   @File.jack          following runs come from this file
+#   <n> <dline> <dcol>  the next n instructions come from the previous
+#                       run's line/column plus these deltas
+#   <n> -               the next n instructions have no source position
+# Positions are 1-based; deltas carry across file switches.
+
+MAP_HEADER = 'jackmap 1'
+
+def mapPath(vm_path):
+    return vm_path + '.map'
+
+def encodeLineMap(table):
+    # table: one (file, line, col) or None per instruction
+    lines = [MAP_HEADER]
+    file, line, col = None, 0, 0
+    i = 0
+    while i < len(table):
+        origin = table[i]
+        n = 1
+        while i + n < len(table) and table[i + n] == origin:
+            n += 1
+        i += n
+        if origin is None:
+            lines.append(f"{n} -")
+            continue
+        if origin[0] != file:
+            file = origin[0]
+            lines.append('@' + file)
+        lines.append(f"{n} {origin[1] - line} {origin[2] - col}")
+        line, col = origin[1], origin[2]
+    return '\n'.join(lines) + '\n'
+
+def decodeLineMap(text):
+    rows = text.splitlines()
+    if not rows or rows[0] != MAP_HEADER:
+        raise ValueError("not a Jack VM line map")
+    table = []
+    file, line, col = None, 0, 0
+    for row in rows[1:]:
+        if row.startswith('@'):
+            file = row[1:]
+            continue
+        parts = row.split()
+        if parts[1] == '-':
+            table.extend([None] * int(parts[0]))
+            continue
+        line += int(parts[1])
+        col += int(parts[2])
+        table.extend([(file, line, col)] * int(parts[0]))
+    return table
+
+def writeLineMap(vm_path, table):
+    with open(mapPath(vm_path), 'w') as f:
+        f.write(encodeLineMap(table))
+
+def readLineMap(vm_path):
+    # the table for vm_path, or None when it was compiled without --source-map
+    path = mapPath(vm_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return decodeLineMap(f.read())
@@ -1,30 +1,58 @@
+# VM segment for each kind of symbol
+KIND_SEGMENTS = {'static': 'static', 'field': 'this', 'arg': 'argument', 'var': 'local'}
+
+class Symbol:
+    __slots__ = ('type', 'kind', 'index', 'resolved')
+    def __init__(self, type_, kind, index):
+        self.type = type_
+        self.kind = kind
+        self.index = index
+        # what resolve() hands out: (segment, index, type)
+        self.resolved = (KIND_SEGMENTS[kind], index, type_)
+
 class SymbolTable:
     def __init__(self):
         self.class_scope = {}
         self.subroutine_scope = {}
         self.counters = {'static':0,'field':0,'arg':0,'var':0}
+        # name -> (segment, index, type) for names already looked up in this subroutine
+        self.resolved = {}
     def startSubroutine(self):
         self.subroutine_scope.clear()
+        self.resolved.clear()
         self.counters['arg']=0
         self.counters['var']=0
-    def define(self,name, type_, kind):
-        idx=self.counters[kind]
-        entry={'type':type_,'kind':kind,'index':idx}
+    def define(self,name, type_, kind, index=None):
+        # index: a slot chosen by the caller (packed locals), else the next one
+        idx=self.counters[kind] if index is None else index
+        entry=Symbol(type_, kind, idx)
         if kind in ('static','field'):
             self.class_scope[name]=entry
         else:
             self.subroutine_scope[name]=entry
+        self.resolved.pop(name, None)
         self.counters[kind]+=1
     def varCount(self,kind): return self.counters[kind]
+    def lookup(self,name):
+        # the Symbol for name, or None if it is not defined
+        entry = self.subroutine_scope.get(name)
+        return entry if entry is not None else self.class_scope.get(name)
+    def resolve(self,name):
+        # (segment, index, type) for a variable, or None if name is undefined
+        # (e.g. a class name in Foo.bar())
+        hit = self.resolved.get(name)
+        if hit is None:
+            entry = self.lookup(name)
+            if entry is None:
+                return None
+            hit = self.resolved[name] = entry.resolved
+        return hit
     def kindOf(self,name):
-        if name in self.subroutine_scope: return self.subroutine_scope[name]['kind']
-        if name in self.class_scope: return self.class_scope[name]['kind']
-        return None
+        entry = self.lookup(name)
+        return entry.kind if entry is not None else None
     def typeOf(self,name):
-        if name in self.subroutine_scope: return self.subroutine_scope[name]['type']
-        if name in self.class_scope: return self.class_scope[name]['type']
-        return None
+        entry = self.lookup(name)
+        return entry.type if entry is not None else None
     def indexOf(self,name):
-        if name in self.subroutine_scope: return self.subroutine_scope[name]['index']
-        if name in self.class_scope: return self.class_scope[name]['index']
-        return None
+        entry = self.lookup(name)
+        return entry.index if entry is not None else None
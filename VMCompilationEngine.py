@@ -1,79 +1,135 @@
-from VMWriter import VMWriter
-from SymbolTable import SymbolTable
+from VMWriter import VMWriter, formatInstruction, Op, CONSTANT
+from SymbolTable import SymbolTable, KIND_SEGMENTS
+from JackParser import parseFile
+from JackTokenizer import IDENTIFIER
+from Liveness import packLocals
 
 class VMCompilationEngine:
     # Map Jack kinds to VM segments
-    segment_map = {
-        'static': 'static',
-        'field':  'this',
-        'arg':    'argument',
-        'var':    'local'
+    segment_map = KIND_SEGMENTS
+    # Binary operators with a VM command, and those implemented by the OS
+    op_map = {
+        '+': 'add', '-': 'sub',
+        '&': 'and', '|': 'or',
+        '<': 'lt', '>': 'gt', '=': 'eq'
     }
+    os_ops = {'*': 'Math.multiply', '/': 'Math.divide'}
 
-    def __init__(self, tokenizer, symbol_table: SymbolTable, writer: VMWriter, class_name: str):
+    def __init__(self, tokenizer, symbol_table: SymbolTable, writer: VMWriter, class_name: str,
+                 optimize: bool = False, pool_strings: bool = False):
         self.tokenizer = tokenizer
         self.table = symbol_table
         self.writer = writer
         self.className = class_name
         self.labelCnt = 0
-        # advance to first token
-        self.tokenizer.advance()
+        # fold constant expressions at compile time
+        self.optimize = optimize
+        # build each distinct string literal once into a static slot
+        self.pool_strings = pool_strings
+        self.strings = {}                 # literal -> static index
+        self.usesStrings = False          # current subroutine reads the pool
+        self.subroutineName = None        # current subroutine and statement, for errors
+        self.pos = 0
+        # under -O: element key whose address pointer 1 holds (see _elementKey)
+        self.that = None
+        # per-class figures reported by the compiler driver
+        self.stats = {}
 
     def _newLabel(self, base: str) -> str:
         lbl = f"{base}{self.labelCnt}"
         self.labelCnt += 1
         return lbl
 
-    def compileClass(self):
-        # skip 'class' className '{'
-        self.tokenizer.advance()
-        self.tokenizer.advance()
-        self.tokenizer.advance()
-        # compile class var declarations
-        while self.tokenizer.token() in ('static', 'field'):
-            self.compileClassVarDec()
-        # compile each subroutine
-        while self.tokenizer.token() in ('constructor', 'function', 'method'):
-            self.compileSubroutine()
-        # skip '}'
-        self.tokenizer.advance()
-
-    def compileClassVarDec(self):
-        kind = self.tokenizer.token()
-        self.tokenizer.advance()
-        type_ = self.tokenizer.token(); self.tokenizer.advance()
-        name = self.tokenizer.token()
-        self.table.define(name, type_, kind)
-        self.tokenizer.advance()
-        while self.tokenizer.token() == ',':
-            self.tokenizer.advance()
-            name = self.tokenizer.token()
+    def resolve(self, name):
+        # (segment, index, type) of a variable the code reads or writes
+        var = self.table.resolve(name)
+        if var is None:
+            line, col = self.tokenizer.stream.position(self.tokenizer.data, self._namePos(name))
+            raise ValueError(f"{self.tokenizer.filename}:{line}:{col}: undefined variable '{name}'"
+                             f" in {self.subroutineName}")
+        return var
+
+    def _namePos(self, name):
+        # token index of the first use of name as a variable (not a class or
+        # subroutine name) in the current statement; the AST keeps positions
+        # of statements only, so this is only worth doing for an error
+        stream = self.tokenizer.stream
+        values, kinds = stream.values, stream.kinds
+        for i in range(self.pos, len(values) - 1):
+            if (values[i] == name and kinds[i] == IDENTIFIER
+                    and values[i - 1] != '.' and values[i + 1] not in ('(', '.')):
+                return i
+        return self.pos
+
+    def _mark(self, pos):
+        # attribute the instructions that follow to token pos (only when the
+        # writer collects a source map)
+        if self.writer.origins is not None:
+            self.writer.where = self.tokenizer.stream.position(self.tokenizer.data, pos)
+
+    def compileClass(self, tree=None):
+        # tree: the JackParser AST, parsed from the tokenizer if not given
+        if tree is None:
+            tree = parseFile(self.tokenizer)
+        _, pos, _, class_vars, subroutines = tree
+        for dec in class_vars:
+            self.compileClassVarDec(dec)
+        # pooled literals go after the declared statics
+        self.stringBase = self.table.varCount('static')
+        for node in subroutines:
+            self.compileSubroutine(node)
+        if self.strings:
+            self._mark(pos)
+            self.compileStringPool()
+
+    def _stringInitName(self):
+        return f"{self.className}.initStrings__"
+
+    def compileStringPool(self):
+        # Class initializer that builds every pooled literal; functions using
+        # the pool call it on entry while the first slot is still 0
+        self.writer.writeFunction(self._stringInitName(), 0)
+        for s, idx in self.strings.items():
+            self.genNewString(s)
+            self.writer.writePop('static', idx)
+        self.writer.writePush('constant', 0)
+        self.writer.writeReturn()
+        self._count('pooled_literals', len(self.strings))
+        self._count('pool_code_saved', -len(self.writer.code))
+        self._count('pool_bytes_saved', -_codeSize(self.writer.code))
+
+    def _count(self, key, n):
+        self.stats[key] = self.stats.get(key, 0) + n
+
+    def compileClassVarDec(self, dec):
+        kind, type_, names = dec
+        for name in names:
             self.table.define(name, type_, kind)
-            self.tokenizer.advance()
-        self.tokenizer.advance()  # ';'
 
-    def compileSubroutine(self):
-        subType = self.tokenizer.token()  # constructor|function|method
-        self.tokenizer.advance()
-        self.tokenizer.advance()          # return type
-        name = self.tokenizer.token(); self.tokenizer.advance()
+    def compileSubroutine(self, node):
+        _, pos, subType, _, name, params, local_vars, body = node
+        self._mark(pos)
+        where = self.writer.where
 
         # start subroutine scope
         self.table.startSubroutine()
-
-        # parameter list
-        self.tokenizer.advance()          # '('
-        nArgs = self.compileParameterList()
-        self.tokenizer.advance()          # ')'
-
-        # subroutine body
-        self.tokenizer.advance()          # '{'
-        while self.tokenizer.token() == 'var':
-            self.compileVarDec()
-        nLocals = self.table.varCount('var')
+        for type_, arg in params:
+            self.table.define(arg, type_, 'arg')
+        if self.optimize:
+            # locals that are never live at once share a slot
+            slots, nLocals = packLocals(body, [var for _, names in local_vars for var in names])
+            for type_, names in local_vars:
+                for var in names:
+                    self.table.define(var, type_, 'var', slots.get(var, 0))
+            self._count('locals_saved', self.table.varCount('var') - nLocals)
+        else:
+            for type_, names in local_vars:
+                for var in names:
+                    self.table.define(var, type_, 'var')
+            nLocals = self.table.varCount('var')
 
         # function declaration
-        funcName = f"{self.className}.{name}"
+        funcName = self.subroutineName = f"{self.className}.{name}"
         self.writer.writeFunction(funcName, nLocals)
 
         # constructor: allocate fields and set this
@@ -89,103 +145,177 @@ class VMCompilationEngine:
             self.writer.writePop('pointer', 0)
 
         # compile statements
-        self.compileStatements()
-        # skip '}'
-        self.tokenizer.advance()
-
-    def compileParameterList(self) -> int:
-        cnt = 0
-        if self.tokenizer.token() != ')':
-            type_ = self.tokenizer.token(); self.tokenizer.advance()
-            name = self.tokenizer.token()
-            self.table.define(name, type_, 'arg')
-            self.tokenizer.advance(); cnt += 1
-            while self.tokenizer.token() == ',':
-                self.tokenizer.advance()
-                type_ = self.tokenizer.token(); self.tokenizer.advance()
-                name = self.tokenizer.token()
-                self.table.define(name, type_, 'arg')
-                self.tokenizer.advance(); cnt += 1
-        return cnt
-
-    def compileVarDec(self):
-        self.tokenizer.advance()          # 'var'
-        type_ = self.tokenizer.token(); self.tokenizer.advance()
-        name = self.tokenizer.token()
-        self.table.define(name, type_, 'var')
-        self.tokenizer.advance()
-        while self.tokenizer.token() == ',':
-            self.tokenizer.advance()
-            name = self.tokenizer.token()
-            self.table.define(name, type_, 'var')
-            self.tokenizer.advance()
-        self.tokenizer.advance()          # ';'
-
-    def compileStatements(self):
-        while self.tokenizer.token() in ('let', 'if', 'while', 'do', 'return'):
-            cmd = self.tokenizer.token()
-            getattr(self, f"compile{cmd.capitalize()}")()
-
-    def compileDo(self):
-        self.tokenizer.advance()          # 'do'
-        self.compileSubroutineCall()
+        self.usesStrings = False
+        self.compileStatements(body)
+        if self.usesStrings:
+            self.writer.where = where
+            self.compileStringGuard()
+
+    def compileStringGuard(self):
+        # push static base; if-goto READY; call init; pop temp 0; label READY
+        ready = self._newLabel('STRINGS_READY')
+        guard = VMWriter()
+        guard.writePush('static', self.stringBase)
+        guard.writeIf(ready)
+        guard.writeCall(self._stringInitName(), 0)
+        guard.writePop('temp', 0)
+        guard.writeLabel(ready)
+        code = list(guard.instructions())
+        # right after the 'function' line of the current subroutine
+        self.writer.insert(1, code)
+        self._count('pool_code_saved', -len(code))
+        self._count('pool_bytes_saved', -_codeSize(code))
+
+    def compileStatements(self, statements):
+        # code emitted after the block (e.g. a loop's goto) belongs to the
+        # enclosing statement again
+        where, pos = self.writer.where, self.pos
+        for node in statements:
+            self.pos = node[1]
+            self._mark(node[1])
+            self.that = None
+            getattr(self, f"compile{node[0].capitalize()}")(node)
+        self.writer.where, self.pos = where, pos
+
+    def compileDo(self, node):
+        self.compileSubroutineCall(node[2])
         self.writer.writePop('temp', 0)
-        self.tokenizer.advance()          # ';'
-
-    def compileLet(self):
-        self.tokenizer.advance()          # 'let'
-        varName = self.tokenizer.token(); self.tokenizer.advance()
-        isArray = False
-        if self.tokenizer.token() == '[':
-            isArray = True
-            self.tokenizer.advance()
-            self.compileExpression()
-            self.tokenizer.advance()      # ']'
-            seg = self.segment_map[self.table.kindOf(varName)]
-            idx = self.table.indexOf(varName)
+
+    def compileLet(self, node):
+        _, _, varName, index, value = node
+        if index is not None and self.optimize:
+            self.compileArrayLet(varName, foldConstants(index), foldConstants(value))
+            return
+        if index is not None:
+            self.compileExpression(index)
+            seg, idx, _ = self.resolve(varName)
             self.writer.writePush(seg, idx)
             self.writer.writeArithmetic('add')
-        self.tokenizer.advance()          # '='
-        self.compileExpression()
-        self.tokenizer.advance()          # ';'
-        if isArray:
+        self.compileExpression(value)
+        if index is not None:
             self.writer.writePop('temp', 0)
             self.writer.writePop('pointer', 1)
             self.writer.writePush('temp', 0)
             self.writer.writePop('that', 0)
         else:
-            seg = self.segment_map[self.table.kindOf(varName)]
-            idx = self.table.indexOf(varName)
+            seg, idx, _ = self.resolve(varName)
             self.writer.writePop(seg, idx)
 
-    def compileWhile(self):
+    def compileArrayLet(self, name, index, value):
+        # a[i] = value without the temp 0 shuffle where possible:
+        #  - value leaves pointer 1 alone: address; value; pop that
+        #  - value may call, but cannot change a or i (a frame variable indexed
+        #    by frame variables): value; address; pop that
+        key = _elementKey(name, index)
+        if _keepsThat(value, key, self.pool_strings):
+            offset = self.genAddress(name, index)
+            self.genExpression(value)
+        elif self._inFrame(('var', name)) and self._inFrame(index):
+            self.genExpression(value)
+            offset = self.genAddress(name, index)
+        else:
+            offset = self.genAddress(name, index, False)
+            self.genExpression(value)
+            self.writer.writePop('temp', 0)
+            self.writer.writePop('pointer', 1)
+            self.writer.writePush('temp', 0)
+            self.that = None
+        self.writer.writePop('that', offset)
+
+    def _inFrame(self, node):
+        # built from constants and locals/arguments only, so no call made by
+        # the current subroutine can change its value
+        kind = node[0]
+        if kind in ('int', 'keyword'):
+            return True
+        if kind == 'var':
+            return self.resolve(node[1])[0] in ('local', 'argument')
+        if kind == 'unary':
+            return self._inFrame(node[2])
+        if kind == 'binary':
+            return node[1] not in ('*', '/') and self._inFrame(node[2]) and self._inFrame(node[3])
+        return False
+
+    def genAddress(self, name, index, point=True):
+        # Leave the address of name[index] in pointer 1 (point=False: on the
+        # stack) and return the 'that' offset it is read at. A constant index
+        # becomes the offset, so only the base is pushed.
+        constant = index[0] == 'int' and index[1] >= 0
+        if not constant:
+            self.genExpression(index)
+        seg, idx, _ = self.resolve(name)
+        self.writer.writePush(seg, idx)
+        if not constant:
+            self.writer.writeArithmetic('add')
+        if point:
+            self.writer.writePop('pointer', 1)
+            self.that = _elementKey(name, index)
+        return index[1] if constant else 0
+
+    def genElement(self, name, index):
+        # push name[index], reusing pointer 1 when it already holds the address
+        key = _elementKey(name, index)
+        if key is not None and key == self.that:
+            offset = index[1] if key[1] is None else 0
+        else:
+            offset = self.genAddress(name, index)
+        self.writer.writePush('that', offset)
+
+    def compileWhile(self, node):
+        _, _, cond, body = node
+        if self.optimize:
+            cond = foldConstants(cond)
+            # 'not; if-goto' makes only -1 true, so the loop can test at the
+            # bottom with a plain if-goto only when cond is 0 or -1
+            if cond[0] == 'int' or _isBoolean(cond):
+                self.compileRotatedWhile(cond, body)
+                return
         start = self._newLabel('WHILE_EXP')
         end = self._newLabel('WHILE_END')
         self.writer.writeLabel(start)
-        self.tokenizer.advance(); self.tokenizer.advance()
-        self.compileExpression()
-        self.tokenizer.advance()
+        self.compileExpression(cond)
         self.writer.writeArithmetic('not')
         self.writer.writeIf(end)
-        self.tokenizer.advance()
-        self.compileStatements()
-        self.tokenizer.advance()
+        self.compileStatements(body)
         self.writer.writeGoto(start)
         self.writer.writeLabel(end)
 
-    def compileReturn(self):
-        self.tokenizer.advance()          # 'return'
-        if self.tokenizer.token() != ';':
-            self.compileExpression()
+    def compileReturn(self, node):
+        if node[2] is not None:
+            self.compileExpression(node[2])
         else:
             self.writer.writePush('constant', 0)
         self.writer.writeReturn()
-        self.tokenizer.advance()          # ';'
 
-    def compileIf(self):
-        self.tokenizer.advance(); self.tokenizer.advance()
-        self.compileExpression()
-        self.tokenizer.advance()
+    def compileRotatedWhile(self, cond, body):
+        # Test at the bottom, entered once through a jump:
+        #   goto WHILE_EXP; label WHILE_BODY; body; label WHILE_EXP; cond; if-goto WHILE_BODY
+        # so an iteration runs no 'not' and no 'goto'
+        cond = foldConstants(cond)
+        test = self._newLabel('WHILE_EXP')
+        top = self._newLabel('WHILE_BODY')
+        if cond[0] == 'int':
+            # while (true) needs no test; any other constant is false and
+            # needs no code at all
+            if cond[1] == -1:
+                self.writer.writeLabel(top)
+                self.compileStatements(body)
+                self.writer.writeGoto(top)
+            return
+        self.writer.writeGoto(test)
+        self.writer.writeLabel(top)
+        self.compileStatements(body)
+        self.writer.writeLabel(test)
+        # reached from the entry jump too
+        self.that = None
+        self.genBranch(cond, top, True)
+
+    def compileIf(self, node):
+        _, _, cond, then, otherwise = node
+        if self.optimize:
+            self.compileBranchingIf(cond, then, otherwise)
+            return
+        self.compileExpression(cond)
 
         false_lbl = self._newLabel('IF_FALSE')
         end_lbl = self._newLabel('IF_END')
@@ -193,45 +323,105 @@ class VMCompilationEngine:
         self.writer.writeArithmetic('not')
         self.writer.writeIf(false_lbl)
 
-        self.tokenizer.advance(); self.compileStatements(); self.tokenizer.advance()
+        self.compileStatements(then)
         self.writer.writeGoto(end_lbl)
 
         self.writer.writeLabel(false_lbl)
-        if self.tokenizer.token() == 'else':
-            self.tokenizer.advance(); self.tokenizer.advance()
-            self.compileStatements()
-            self.tokenizer.advance()
+        if otherwise is not None:
+            self.compileStatements(otherwise)
 
         self.writer.writeLabel(end_lbl)
 
-    def compileExpression(self):
-        self.compileTerm()
-        while self.tokenizer.token() in ('+', '-', '*', '/', '&', '|', '<', '>', '='):
-            op = self.tokenizer.token(); self.tokenizer.advance()
-            self.compileTerm()
-            mapping = {
-                '+': 'add', '-': 'sub',
-                '*': 'call Math.multiply 2', '/': 'call Math.divide 2',
-                '&': 'and', '|': 'or',
-                '<': 'lt', '>': 'gt', '=': 'eq'
-            }
-            self.writer.writeArithmetic(mapping[op])
-
-    def compileTerm(self):
-        ttype = self.tokenizer.tokenType()
-        token = self.tokenizer.token()
-        if ttype == 'INT_CONST':
-            self.writer.writePush('constant', int(token))
-            self.tokenizer.advance()
-        elif ttype == 'STRING_CONST':
-            s = token.strip('"')
-            self.writer.writePush('constant', len(s))
-            self.writer.writeCall('String.new', 1)
-            for ch in s:
-                self.writer.writePush('constant', ord(ch))
-                self.writer.writeCall('String.appendChar', 2)
-            self.tokenizer.advance()
-        elif token in ('true', 'false', 'null', 'this'):
+    def compileBranchingIf(self, cond, then, otherwise):
+        # Branch without a 'not' where the condition allows it. If jumping on
+        # a false condition is free, jump over 'then':
+        #   inverted cond; if-goto IF_FALSE; then; goto IF_END; label IF_FALSE; else; label IF_END
+        # (without an else, straight to IF_END); otherwise jump on true:
+        #   cond; if-goto IF_TRUE; else; goto IF_END; label IF_TRUE; then; label IF_END
+        # The latter is only right for a cond that is 0 or -1: like the plain
+        # build, any other value is false ('not' of it is nonzero).
+        cond = foldConstants(cond)
+        end_lbl = self._newLabel('IF_END')
+        if not _isBoolean(cond) or _branchForm(cond, False)[1]:
+            false_lbl = self._newLabel('IF_FALSE') if otherwise is not None else end_lbl
+            self.genBranch(cond, false_lbl, False)
+            self.compileStatements(then)
+            if otherwise is not None:
+                self.writer.writeGoto(end_lbl)
+                self.writer.writeLabel(false_lbl)
+                self.compileStatements(otherwise)
+            self.writer.writeLabel(end_lbl)
+            return
+        true_lbl = self._newLabel('IF_TRUE')
+        self.genBranch(cond, true_lbl, True)
+        if otherwise is not None:
+            self.compileStatements(otherwise)
+        self.writer.writeGoto(end_lbl)
+        self.writer.writeLabel(true_lbl)
+        self.compileStatements(then)
+        self.writer.writeLabel(end_lbl)
+
+    def genBranch(self, cond, label, when):
+        # if-goto label when cond is true (when=True) or false (when=False)
+        cond, when = _branchForm(cond, when)
+        self.genExpression(cond)
+        if not when:
+            self.writer.writeArithmetic('not')
+        self.writer.writeIf(label)
+
+    # Expressions come from the parser as a small tree of tuples (see
+    # JackParser), are optionally folded, then emitted
+
+    def compileExpression(self, node):
+        if self.optimize:
+            node = foldConstants(node)
+        self.genExpression(node)
+
+    def compileSubroutineCall(self, node):
+        if self.optimize:
+            node = foldConstants(node)
+        self.genSubroutineCall(node)
+
+    def genConstant(self, value):
+        if value >= 0:
+            self.writer.writePush('constant', value)
+        else:
+            # ~value is in 0..32767 for every 16-bit negative
+            self.writer.writePush('constant', ~value)
+            self.writer.writeArithmetic('not')
+
+    def genNewString(self, s):
+        self.writer.writePush('constant', len(s))
+        self.writer.writeCall('String.new', 1)
+        for ch in s:
+            self.writer.writePush('constant', ord(ch))
+            self.writer.writeCall('String.appendChar', 2)
+        self.that = None
+
+    def genPooledString(self, s):
+        if s not in self.strings:
+            self.strings[s] = self.stringBase + len(self.strings)
+        self.writer.writePush('static', self.strings[s])
+        self.usesStrings = True
+        # what genNewString would have emitted, minus the single push
+        inline = _newStringCode(s)
+        self._count('pooled_uses', 1)
+        self._count('pool_code_saved', len(inline) - 1)
+        self._count('pool_bytes_saved', _codeSize(inline) - len(formatInstruction(self.writer.code[-1])))
+        # executed instructions saved each time this use runs
+        self._count('pool_run_saved', len(inline) - 1)
+
+    def genExpression(self, node):
+        kind = node[0]
+        if kind == 'int':
+            self.genConstant(node[1])
+        elif kind == 'str':
+            if self.pool_strings:
+                self.genPooledString(node[1])
+            else:
+                self.genNewString(node[1])
+        elif kind == 'keyword':
+            token = node[1]
             if token == 'true':
                 self.writer.writePush('constant', 0)
                 self.writer.writeArithmetic('not')
@@ -239,57 +429,246 @@ class VMCompilationEngine:
                 self.writer.writePush('constant', 0)
             else:
                 self.writer.writePush('pointer', 0)
-            self.tokenizer.advance()
-        elif token == '(':
-            self.tokenizer.advance(); self.compileExpression(); self.tokenizer.advance()
-        elif token in ('-', '~'):
-            op = token; self.tokenizer.advance(); self.compileTerm();
-            self.writer.writeArithmetic('neg' if op == '-' else 'not')
+        elif kind == 'var':
+            seg, idx, _ = self.resolve(node[1])
+            self.writer.writePush(seg, idx)
+        elif kind == 'index' and self.optimize:
+            self.genElement(node[1], node[2])
+        elif kind == 'index':
+            self.genExpression(node[2])
+            seg, idx, _ = self.resolve(node[1])
+            self.writer.writePush(seg, idx); self.writer.writeArithmetic('add')
+            self.writer.writePop('pointer', 1); self.writer.writePush('that', 0)
+        elif kind == 'call':
+            self.genSubroutineCall(node)
+        elif kind == 'paren':
+            self.genExpression(node[1])
+        elif kind == 'unary':
+            self.genExpression(node[2])
+            self.writer.writeArithmetic('neg' if node[1] == '-' else 'not')
+        else:
+            op = node[1]
+            if self.optimize and op in self.os_ops and self.genStrengthReduced(node):
+                return
+            self.genExpression(node[2])
+            self.genExpression(node[3])
+            if op in self.os_ops:
+                self.writer.writeCall(self.os_ops[op], 2)
+                self.that = None
+            else:
+                self.writer.writeArithmetic(self.op_map[op])
+
+    def genStrengthReduced(self, node) -> bool:
+        # x*0, x*1, x/1, x*-1, x/-1 and x * 2^k without calling the OS.
+        # Returns False when the operands don't allow it.
+        op, left, right = node[1:]
+        if right[0] == 'int':
+            operand, k = left, right[1]
+        elif op == '*' and left[0] == 'int':
+            operand, k = right, left[1]
         else:
-            nxt = self.tokenizer.tokens[self.tokenizer.current_index + 1]
-            if nxt == '[':
-                var = token; self.tokenizer.advance(); self.tokenizer.advance()
-                self.compileExpression(); self.tokenizer.advance()
-                seg = self.segment_map[self.table.kindOf(var)]
-                idx = self.table.indexOf(var)
-                self.writer.writePush(seg, idx); self.writer.writeArithmetic('add')
-                self.writer.writePop('pointer', 1); self.writer.writePush('that', 0)
-            elif nxt in ('.', '('):
-                self.compileSubroutineCall()
+            return False
+        if op == '*' and k == 0:
+            if _isPure(operand):
+                self.writer.writePush('constant', 0)
             else:
-                seg = self.segment_map[self.table.kindOf(token)]
-                idx = self.table.indexOf(token)
-                self.writer.writePush(seg, idx); self.tokenizer.advance()
-
-    def compileExpressionList(self) -> int:
-        cnt = 0
-        if self.tokenizer.token() != ')':
-            self.compileExpression(); cnt += 1
-            while self.tokenizer.token() == ',':
-                self.tokenizer.advance(); self.compileExpression(); cnt += 1
-        return cnt
-
-    def compileSubroutineCall(self):
-        name = self.tokenizer.token(); self.tokenizer.advance()
+                self.genExpression(operand)
+                self.writer.writePop('temp', 0)
+                self.writer.writePush('constant', 0)
+        elif k == 1:
+            self.genExpression(operand)
+        elif k == -1:
+            self.genExpression(operand)
+            self.writer.writeArithmetic('neg')
+        elif op == '*' and k > 0 and k & (k - 1) == 0:
+            # doubling: x+x, then (temp 1)+(temp 1) for each further power
+            shifts = k.bit_length() - 1
+            self.genExpression(operand)
+            if operand[0] == 'var':
+                self.genExpression(operand)
+                self.writer.writeArithmetic('add')
+                shifts -= 1
+            for _ in range(shifts):
+                self.writer.writePop('temp', 1)
+                self.writer.writePush('temp', 1)
+                self.writer.writePush('temp', 1)
+                self.writer.writeArithmetic('add')
+        else:
+            return False
+        self._count('strength_reduced', 1)
+        return True
+
+    def genSubroutineCall(self, node):
+        _, name, sub, args = node
         nArgs = 0
-        if self.tokenizer.token() == '.':
-            self.tokenizer.advance()
-            sub = self.tokenizer.token()
-            if self.table.kindOf(name):
-                seg = self.segment_map[self.table.kindOf(name)]
-                idx = self.table.indexOf(name)
+        if sub is not None:
+            var = self.table.resolve(name)
+            if var is not None:
+                seg, idx, type_ = var
                 self.writer.writePush(seg, idx)
-                name = f"{self.table.typeOf(name)}.{sub}"
+                name = f"{type_}.{sub}"
                 nArgs += 1
             else:
                 name = f"{name}.{sub}"
-            self.tokenizer.advance()
         else:
             # method on this
             self.writer.writePush('pointer', 0)
             name = f"{self.className}.{name}"
             nArgs += 1
-        self.tokenizer.advance()  # '('
-        n = self.compileExpressionList()
-        self.tokenizer.advance()  # ')'
-        self.writer.writeCall(name, nArgs + n)
+        for arg in args:
+            self.genExpression(arg)
+        self.writer.writeCall(name, nArgs + len(args))
+        # the callee (or an accessor inlined here) may move pointer 1
+        self.that = None
+
+
+def _newStringCode(s):
+    # instructions genNewString emits for s
+    code = [(Op.PUSH, CONSTANT, len(s)), (Op.CALL, 'String.new', 1)]
+    for ch in s:
+        code.append((Op.PUSH, CONSTANT, ord(ch)))
+        code.append((Op.CALL, 'String.appendChar', 2))
+    return code
+
+def _codeSize(code):
+    return sum(len(formatInstruction(ins)) for ins in code)
+
+def _isPure(node):
+    # no calls or allocations, so evaluating it can be skipped
+    kind = node[0]
+    if kind in ('int', 'keyword', 'var'):
+        return True
+    if kind == 'index':
+        return _isPure(node[2])
+    if kind == 'paren':
+        return _isPure(node[1])
+    if kind == 'unary':
+        return _isPure(node[2])
+    if kind == 'binary':
+        return node[1] not in ('*', '/') and _isPure(node[2]) and _isPure(node[3])
+    return False
+
+def _elementKey(name, index):
+    # What pointer 1 holds after genAddress(name, index): (name, None) for a
+    # constant index (the base itself), (name, index) for another pure index;
+    # None when the index has side effects
+    if index[0] == 'int' and index[1] >= 0:
+        return (name, None)
+    if _isPure(index):
+        return (name, index)
+    return None
+
+def _keepsThat(node, key, pooled):
+    # evaluating node leaves pointer 1 at key: no calls, and every element
+    # read goes through the same address
+    kind = node[0]
+    if kind in ('int', 'keyword', 'var'):
+        return True
+    if kind == 'str':
+        return pooled
+    if kind == 'index':
+        return key is not None and _elementKey(node[1], node[2]) == key
+    if kind == 'paren':
+        return _keepsThat(node[1], key, pooled)
+    if kind == 'unary':
+        return _keepsThat(node[2], key, pooled)
+    if kind == 'binary':
+        return (node[1] not in ('*', '/') and _keepsThat(node[2], key, pooled)
+                and _keepsThat(node[3], key, pooled))
+    return False
+
+def _isBoolean(node):
+    # always 0 or -1, so '~' on it is a logical not
+    kind = node[0]
+    if kind == 'int':
+        return node[1] in (0, -1)
+    if kind == 'binary':
+        if node[1] in ('<', '>', '='):
+            return True
+        return node[1] in ('&', '|') and _isBoolean(node[2]) and _isBoolean(node[3])
+    if kind == 'unary':
+        return node[1] == '~' and _isBoolean(node[2])
+    return False
+
+def _constantCost(value):
+    # instructions genConstant needs for value
+    return 1 if value >= 0 else 2
+
+def _invert(node):
+    # a condition that is true exactly when node is false and costs no more
+    # to evaluate, or None
+    kind = node[0]
+    if kind == 'unary' and node[1] == '~' and _isBoolean(node[2]):
+        return node[2]
+    if kind == 'binary' and node[1] in ('<', '>'):
+        op, left, right = node[1:]
+        if left[0] == 'int':
+            # c < x is x > c
+            op, left, right = ('>' if op == '<' else '<'), right, left
+        if right[0] == 'int':
+            c = right[1]
+            # not (x < c) is x > c-1; not (x > c) is x < c+1
+            if op == '<' and c > -32768 and _constantCost(c - 1) <= _constantCost(c):
+                return ('binary', '>', left, ('int', c - 1))
+            if op == '>' and c < 32767 and _constantCost(c + 1) <= _constantCost(c):
+                return ('binary', '<', left, ('int', c + 1))
+    return None
+
+def _branchForm(cond, when):
+    # (condition, when) to emit for "jump if cond is `when`", with negations
+    # folded into the jump; when comes back False only if a 'not' is needed
+    while cond[0] == 'unary' and cond[1] == '~' and _isBoolean(cond[2]):
+        cond, when = cond[2], not when
+    if not when:
+        inverted = _invert(cond)
+        if inverted is not None:
+            return inverted, True
+    return cond, when
+
+def wrap16(value):
+    # two's-complement 16-bit wraparound, as on the Hack platform
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+def _divide(a, b):
+    # Math.divide truncates toward zero
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+_FOLD_BINARY = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': _divide,
+    '&': lambda a, b: a & b,
+    '|': lambda a, b: a | b,
+    '<': lambda a, b: -1 if a < b else 0,
+    '>': lambda a, b: -1 if a > b else 0,
+    '=': lambda a, b: -1 if a == b else 0,
+}
+_KEYWORD_VALUES = {'true': -1, 'false': 0, 'null': 0}
+
+def foldConstants(node):
+    # Evaluate constant subtrees at compile time with 16-bit semantics
+    kind = node[0]
+    if kind == 'paren':
+        return foldConstants(node[1])
+    if kind == 'keyword' and node[1] in _KEYWORD_VALUES:
+        return ('int', _KEYWORD_VALUES[node[1]])
+    if kind == 'unary':
+        term = foldConstants(node[2])
+        if term[0] == 'int':
+            return ('int', wrap16(-term[1] if node[1] == '-' else ~term[1]))
+        return ('unary', node[1], term)
+    if kind == 'binary':
+        op = node[1]
+        left = foldConstants(node[2])
+        right = foldConstants(node[3])
+        # division by zero is left for Math.divide to report at run time
+        if left[0] == 'int' and right[0] == 'int' and not (op == '/' and right[1] == 0):
+            return ('int', wrap16(_FOLD_BINARY[op](wrap16(left[1]), wrap16(right[1]))))
+        return ('binary', op, left, right)
+    if kind == 'index':
+        return ('index', node[1], foldConstants(node[2]))
+    if kind == 'call':
+        return ('call', node[1], node[2], [foldConstants(arg) for arg in node[3]])
+    return node
@@ -0,0 +1,545 @@
+import os
+import sys
+import glob
+import json
+import argparse
+from bisect import bisect_right
+from VMWriter import Op, parseVM, CONSTANT, ARGUMENT, LOCAL, STATIC, THIS, THAT, TEMP
+import SourceMap
+
+# Headless executor for the compiler's .vm output. The program is decoded
+# once into a flat array of (opcode, a, b) tuples with labels, functions,
+# static and fixed segment addresses already resolved, then run by a single
+# dispatch loop that counts executed instructions per address.
+# OS classes are Python stubs (see OS below) that work on the same RAM.
+
+# Hack RAM layout
+SP, LCL, ARG, THIS_PTR, THAT_PTR = 0, 1, 2, 3, 4
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+RAM_SIZE = 32768
+
+# Decoded opcodes, roughly in order of how often they run
+(PUSH_CONST, PUSH_SEG, PUSH_ADDR, POP_SEG, POP_ADDR, ADD, SUB, NEG, EQ, GT, LT,
+ AND, OR, NOT, GOTO, IF_GOTO, CALL, CALL_OS, FUNCTION, RETURN, LABEL) = range(21)
+
+_SEGMENT_POINTERS = {LOCAL: LCL, ARGUMENT: ARG, THIS: THIS_PTR, THAT: THAT_PTR}
+_ARITHMETIC = {Op.ADD: ADD, Op.SUB: SUB, Op.NEG: NEG, Op.EQ: EQ, Op.GT: GT, Op.LT: LT,
+               Op.AND: AND, Op.OR: OR, Op.NOT: NOT}
+
+# Rough VM-instruction cost of the real Jack OS routines, used only for the
+# "estimated total" line of a report; the stubs themselves run in Python.
+OS_COSTS = {
+    'Math.multiply': 400, 'Math.divide': 350, 'Math.sqrt': 1200, 'Math.abs': 10,
+    'Math.min': 10, 'Math.max': 10,
+    'Memory.alloc': 60, 'Memory.deAlloc': 30, 'Memory.peek': 5, 'Memory.poke': 5,
+    'Array.new': 70, 'Array.dispose': 40,
+    'String.new': 90, 'String.dispose': 40, 'String.appendChar': 25, 'String.length': 5,
+    'String.charAt': 10, 'String.setCharAt': 10, 'String.eraseLastChar': 10,
+    'String.intValue': 150, 'String.setInt': 250,
+    'Output.printChar': 300, 'Output.printString': 300, 'Output.printInt': 900,
+    'Output.println': 20, 'Output.moveCursor': 30, 'Output.backSpace': 20,
+    'Screen.drawPixel': 60, 'Screen.drawLine': 2000, 'Screen.drawRectangle': 3000,
+    'Screen.drawCircle': 5000, 'Screen.clearScreen': 80000, 'Screen.setColor': 5,
+}
+
+class VMError(Exception):
+    pass
+
+class Halt(Exception):
+    pass
+
+def _wrap(value):
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+class OS:
+    """Python stand-ins for the Jack OS classes, operating on the VM's RAM."""
+
+    def __init__(self, ram, keys=(), inputs=()):
+        self.ram = ram
+        self.output = []
+        self.free = {}               # block size -> freed addresses
+        self.heap_top = HEAP_BASE
+        self.keys = list(keys)       # [(key code, number of keyPressed calls)]
+        self.inputs = list(inputs)   # values for readInt/readLine/readChar
+        self.color = True
+
+    def functions(self):
+        # {'Class.name': (python callable, number of arguments)}
+        table = {}
+        for attr in dir(self):
+            if attr[0].isupper() and '_' in attr:
+                cls, name = attr.split('_', 1)
+                fn = getattr(self, attr)
+                table[f"{cls}.{name}"] = (fn, fn.__code__.co_argcount - 1)
+        return table
+
+    # Memory / Array
+    def Memory_alloc(self, size):
+        size = max(size, 1)
+        if self.free.get(size):
+            return self.free[size].pop()
+        addr = self.heap_top
+        if addr + size + 1 > HEAP_END:
+            raise VMError("Heap overflow")
+        self.ram[addr] = size        # block header
+        self.heap_top += size + 1
+        return addr + 1
+    def Memory_deAlloc(self, obj):
+        if obj > HEAP_BASE:
+            self.free.setdefault(self.ram[obj - 1], []).append(obj)
+        return 0
+    def Memory_peek(self, addr):
+        return self.ram[addr]
+    def Memory_poke(self, addr, value):
+        self.ram[addr] = value
+        return 0
+    def Array_new(self, size):
+        return self.Memory_alloc(size)
+    def Array_dispose(self, arr):
+        return self.Memory_deAlloc(arr)
+
+    # Math
+    def Math_multiply(self, x, y):
+        return _wrap(x * y)
+    def Math_divide(self, x, y):
+        if y == 0:
+            raise VMError("Math.divide: division by zero")
+        q = abs(x) // abs(y)
+        return _wrap(q if (x < 0) == (y < 0) else -q)
+    def Math_sqrt(self, x):
+        return int(max(x, 0) ** 0.5)
+    def Math_abs(self, x):
+        return _wrap(abs(x))
+    def Math_min(self, x, y):
+        return min(x, y)
+    def Math_max(self, x, y):
+        return max(x, y)
+
+    # String: [maxLength, length, chars...]
+    def String_new(self, maxLength):
+        s = self.Memory_alloc(maxLength + 2)
+        self.ram[s] = maxLength
+        self.ram[s + 1] = 0
+        return s
+    def String_dispose(self, s):
+        return self.Memory_deAlloc(s)
+    def String_length(self, s):
+        return self.ram[s + 1]
+    def String_charAt(self, s, i):
+        return self.ram[s + 2 + i]
+    def String_setCharAt(self, s, i, c):
+        self.ram[s + 2 + i] = c
+        return 0
+    def String_appendChar(self, s, c):
+        n = self.ram[s + 1]
+        if n >= self.ram[s]:
+            raise VMError("String.appendChar: string is full")
+        self.ram[s + 2 + n] = c
+        self.ram[s + 1] = n + 1
+        return s
+    def String_eraseLastChar(self, s):
+        if self.ram[s + 1] > 0:
+            self.ram[s + 1] -= 1
+        return 0
+    def String_intValue(self, s):
+        text = self._text(s)
+        digits = text[1:] if text.startswith('-') else text
+        value = int(digits) if digits.isdigit() else 0
+        return _wrap(-value if text.startswith('-') else value)
+    def String_setInt(self, s, value):
+        self.ram[s + 1] = 0
+        for ch in str(value):
+            self.String_appendChar(s, ord(ch))
+        return 0
+    def String_backSpace(self):
+        return 129
+    def String_doubleQuote(self):
+        return 34
+    def String_newLine(self):
+        return 128
+    def _text(self, s):
+        return ''.join(chr(c) for c in self.ram[s + 2:s + 2 + self.ram[s + 1]])
+
+    # Output
+    def Output_printChar(self, c):
+        self.output.append('\n' if c == 128 else chr(c))
+        return 0
+    def Output_printString(self, s):
+        self.output.append(self._text(s))
+        return 0
+    def Output_printInt(self, i):
+        self.output.append(str(i))
+        return 0
+    def Output_println(self):
+        self.output.append('\n')
+        return 0
+    def Output_moveCursor(self, row, col):
+        return 0
+    def Output_backSpace(self):
+        return 0
+
+    # Screen (headless: calls are counted, nothing is drawn)
+    def Screen_clearScreen(self):
+        return 0
+    def Screen_setColor(self, b):
+        self.color = b != 0
+        return 0
+    def Screen_drawPixel(self, x, y):
+        return 0
+    def Screen_drawLine(self, x1, y1, x2, y2):
+        return 0
+    def Screen_drawRectangle(self, x1, y1, x2, y2):
+        return 0
+    def Screen_drawCircle(self, x, y, r):
+        return 0
+
+    # Keyboard
+    def Keyboard_keyPressed(self):
+        while self.keys and self.keys[0][1] <= 0:
+            self.keys.pop(0)
+        if not self.keys:
+            return 0
+        code, count = self.keys[0]
+        self.keys[0] = (code, count - 1)
+        return code
+    def Keyboard_readChar(self):
+        return ord(str(self.inputs.pop(0))[0]) if self.inputs else 0
+    def Keyboard_readInt(self, message):
+        self.Output_printString(message)
+        return _wrap(int(self.inputs.pop(0))) if self.inputs else 0
+    def Keyboard_readLine(self, message):
+        self.Output_printString(message)
+        text = str(self.inputs.pop(0)) if self.inputs else ''
+        s = self.String_new(max(len(text), 1))
+        for ch in text:
+            self.String_appendChar(s, ord(ch))
+        return s
+
+    # Sys
+    def Sys_wait(self, duration):
+        return 0
+    def Sys_halt(self):
+        raise Halt()
+    def Sys_error(self, code):
+        raise VMError(f"Sys.error({code})")
+
+
+class VMProgram:
+    """A decoded program: instruction array plus function address table."""
+
+    def __init__(self):
+        self.code = []
+        self.functions = {}        # name -> address of its 'function' instruction
+        self.names = []            # function names, in address order
+        self.starts = []           # their addresses, for address -> function lookup
+        self.source = []           # original (op, a, b) record for each address
+        self.origins = None        # (jack file, line, col) per address, from .vm.map files
+
+    def functionAt(self, pc):
+        i = bisect_right(self.starts, pc) - 1
+        return self.names[i] if i >= 0 else None
+
+
+def loadProgram(paths, os_functions):
+    # Decode the .vm files into a VMProgram. Statics are scoped by the class
+    # part of the enclosing function's name, which matches per-file statics
+    # for separate files and stays correct for a linked directory .vm.
+    records = []
+    origins = []
+    mapped = False
+    for path in paths:
+        with open(path) as f:
+            code = parseVM(f.read())
+        table = SourceMap.readLineMap(path)
+        if table is None or len(table) != len(code):
+            table = [None] * len(code)
+        else:
+            mapped = True
+        # drop the writeInit bootstrap in front of the first function; the
+        # interpreter does its own
+        first = next((i for i, ins in enumerate(code) if ins[0] == Op.FUNCTION), len(code))
+        records.extend(code[first:])
+        origins.extend(table[first:])
+    program = VMProgram()
+    if mapped:
+        program.origins = origins
+    static_slots = {}
+    labels = {}
+    func = None
+    # first pass: addresses of functions and (function-scoped) labels
+    for pc, ins in enumerate(records):
+        if ins[0] == Op.FUNCTION:
+            func = ins[1]
+            program.functions[func] = pc
+            program.names.append(func)
+            program.starts.append(pc)
+        elif ins[0] == Op.LABEL:
+            labels[(func, ins[1])] = pc
+    # second pass: decode
+    func = None
+    for pc, (op, a, b) in enumerate(records):
+        if op == Op.FUNCTION:
+            func = a
+            decoded = (FUNCTION, b, None)
+        elif op == Op.PUSH or op == Op.POP:
+            if a == CONSTANT:
+                if op == Op.POP:
+                    raise VMError(f"pop constant in {func}")
+                decoded = (PUSH_CONST, b, None)
+            elif a in _SEGMENT_POINTERS:
+                decoded = (PUSH_SEG if op == Op.PUSH else POP_SEG, _SEGMENT_POINTERS[a], b)
+            else:
+                if a == STATIC:
+                    key = ((func or '').split('.')[0], b)
+                    if key not in static_slots:
+                        static_slots[key] = STATIC_BASE + len(static_slots)
+                    addr = static_slots[key]
+                elif a == TEMP:
+                    addr = TEMP_BASE + b
+                else:
+                    addr = THIS_PTR + b
+                decoded = (PUSH_ADDR if op == Op.PUSH else POP_ADDR, addr, None)
+        elif op in _ARITHMETIC:
+            decoded = (_ARITHMETIC[op], None, None)
+        elif op == Op.LABEL:
+            decoded = (LABEL, None, None)
+        elif op == Op.GOTO or op == Op.IF_GOTO:
+            if (func, a) not in labels:
+                raise VMError(f"Unknown label {a} in {func}")
+            decoded = (GOTO if op == Op.GOTO else IF_GOTO, labels[(func, a)], None)
+        elif op == Op.CALL:
+            if a in program.functions:
+                decoded = (CALL, program.functions[a], b)
+            elif a in os_functions:
+                decoded = (CALL_OS, a, b)
+            else:
+                raise VMError(f"Call to undefined function {a} in {func}")
+        else:
+            decoded = (RETURN, None, None)
+        program.code.append(decoded)
+        program.source.append((op, a, b))
+    return program
+
+
+class VMInterpreter:
+    def __init__(self, paths, keys=(), inputs=()):
+        self.ram = [0] * RAM_SIZE
+        self.os = OS(self.ram, keys, inputs)
+        self.os_functions = self.os.functions()
+        self.program = loadProgram(paths, self.os_functions)
+        self.counts = [0] * len(self.program.code)
+        self.os_calls = {}
+        self.steps = 0
+        self.halted = False
+
+    def run(self, entry=None, max_steps=50_000_000):
+        # Run from Sys.init if the program defines it, else Main.main.
+        # Returns the number of VM instructions executed.
+        program = self.program
+        if entry is None:
+            entry = 'Sys.init' if 'Sys.init' in program.functions else 'Main.main'
+        if entry not in program.functions:
+            raise VMError(f"No entry point {entry}")
+        ram = self.ram
+        code = program.code
+        counts = self.counts
+        os_functions = self.os_functions
+        os_calls = self.os_calls
+        # bootstrap: as if the entry was called with no arguments; returning
+        # to address -1 ends the run
+        ram[SP] = STACK_BASE
+        sp = STACK_BASE
+        for value in (-1, 0, 0, 0, 0):
+            ram[sp] = value
+            sp += 1
+        ram[ARG] = STACK_BASE
+        ram[LCL] = sp
+        pc = program.functions[entry]
+        steps = 0
+        halted = False
+        try:
+            while pc >= 0:
+                if steps >= max_steps:
+                    break
+                steps += 1
+                counts[pc] += 1
+                op, a, b = code[pc]
+                pc += 1
+                if op == PUSH_CONST:
+                    ram[sp] = a; sp += 1
+                elif op == PUSH_SEG:
+                    ram[sp] = ram[ram[a] + b]; sp += 1
+                elif op == PUSH_ADDR:
+                    ram[sp] = ram[a]; sp += 1
+                elif op == POP_SEG:
+                    sp -= 1; ram[ram[a] + b] = ram[sp]
+                elif op == POP_ADDR:
+                    sp -= 1; ram[a] = ram[sp]
+                elif op == ADD:
+                    sp -= 1; v = ram[sp - 1] + ram[sp]
+                    ram[sp - 1] = v - 65536 if v > 32767 else (v + 65536 if v < -32768 else v)
+                elif op == SUB:
+                    sp -= 1; v = ram[sp - 1] - ram[sp]
+                    ram[sp - 1] = v - 65536 if v > 32767 else (v + 65536 if v < -32768 else v)
+                elif op == NEG:
+                    v = -ram[sp - 1]
+                    ram[sp - 1] = v - 65536 if v > 32767 else v
+                elif op == EQ:
+                    sp -= 1; ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                elif op == GT:
+                    sp -= 1; ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                elif op == LT:
+                    sp -= 1; ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                elif op == AND:
+                    sp -= 1; ram[sp - 1] &= ram[sp]
+                elif op == OR:
+                    sp -= 1; ram[sp - 1] |= ram[sp]
+                elif op == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == GOTO:
+                    pc = a
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = a
+                elif op == LABEL:
+                    pass
+                elif op == CALL:
+                    ram[sp] = pc; ram[sp + 1] = ram[LCL]; ram[sp + 2] = ram[ARG]
+                    ram[sp + 3] = ram[THIS_PTR]; ram[sp + 4] = ram[THAT_PTR]
+                    sp += 5
+                    ram[ARG] = sp - 5 - b
+                    ram[LCL] = sp
+                    pc = a
+                elif op == FUNCTION:
+                    for _ in range(a):
+                        ram[sp] = 0; sp += 1
+                elif op == RETURN:
+                    frame = ram[LCL]
+                    ret = ram[frame - 5]
+                    arg = ram[ARG]
+                    ram[arg] = ram[sp - 1]
+                    sp = arg + 1
+                    ram[THAT_PTR] = ram[frame - 1]; ram[THIS_PTR] = ram[frame - 2]
+                    ram[ARG] = ram[frame - 3]; ram[LCL] = ram[frame - 4]
+                    pc = ret
+                elif op == CALL_OS:
+                    fn, nargs = os_functions[a]
+                    if nargs != b:
+                        raise VMError(f"{a} expects {nargs} arguments, got {b}")
+                    os_calls[a] = os_calls.get(a, 0) + 1
+                    ram[SP] = sp
+                    sp -= b
+                    result = fn(*ram[sp:sp + b])
+                    ram[sp] = result; sp += 1
+        except Halt:
+            halted = True
+        finally:
+            ram[SP] = sp
+            self.steps += steps
+        self.halted = halted or pc < 0
+        return steps
+
+    def functionCounts(self):
+        # {function: executed VM instructions}, busiest first
+        totals = {}
+        program = self.program
+        starts = program.starts + [len(self.counts)]
+        for i, name in enumerate(program.names):
+            totals[name] = sum(self.counts[starts[i]:starts[i + 1]])
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def lineCounts(self):
+        # {(jack file, line): executed VM instructions}, busiest first; empty
+        # unless the program was compiled with --source-map
+        totals = {}
+        if self.program.origins is None:
+            return totals
+        for origin, count in zip(self.program.origins, self.counts):
+            if count and origin is not None:
+                key = origin[:2]
+                totals[key] = totals.get(key, 0) + count
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def estimatedTotal(self):
+        # executed VM instructions plus the OS_COSTS estimate for stubbed calls
+        return self.steps + sum(OS_COSTS.get(name, 0) * n for name, n in self.os_calls.items())
+
+    def report(self, top=20):
+        lines = [f"{self.steps} VM instructions executed"
+                 + ("" if self.halted else " (stopped at --max-steps)")]
+        lines.append(f"{self.estimatedTotal()} estimated including OS routines")
+        lines.append("Per function:")
+        for name, count in list(self.functionCounts().items())[:top]:
+            if count:
+                lines.append(f"  {name:<40}{count:>12}")
+        source_lines = self.lineCounts()
+        if source_lines:
+            lines.append("Per source line:")
+            for (file, line), count in list(source_lines.items())[:top]:
+                lines.append(f"  {f'{file}:{line}':<40}{count:>12}")
+        if self.os_calls:
+            lines.append("OS calls:")
+            for name, count in sorted(self.os_calls.items(), key=lambda item: -item[1]):
+                lines.append(f"  {name:<40}{count:>12}")
+        return '\n'.join(lines)
+
+    def toJSON(self):
+        return {'steps': self.steps, 'halted': self.halted,
+                'estimated_total': self.estimatedTotal(),
+                'functions': self.functionCounts(), 'os_calls': self.os_calls,
+                'lines': {f"{file}:{line}": count for (file, line), count in self.lineCounts().items()},
+                'output': ''.join(self.os.output)}
+
+
+def vmFiles(path):
+    # A .vm file, or the .vm files of a directory. A linked <dir>.vm (one
+    # with no <dir>.jack) holds the whole program, so it is run alone when
+    # it is at least as new as every per-class .vm, and left out otherwise.
+    if not os.path.isdir(path):
+        return [path]
+    files = sorted(glob.glob(os.path.join(path, '*.vm')))
+    linked = os.path.join(path, os.path.basename(os.path.normpath(path)) + '.vm')
+    if linked in files and len(files) > 1 and not os.path.exists(linked[:-3] + '.jack'):
+        files.remove(linked)
+        if os.path.getmtime(linked) >= max(os.path.getmtime(f) for f in files):
+            return [linked]
+    return files
+
+def parseKeys(spec):
+    # "0*500,140*1" -> [(0, 500), (140, 1)]: key code * number of keyPressed calls
+    keys = []
+    for item in filter(None, spec.split(',')):
+        code, _, count = item.partition('*')
+        keys.append((int(code), int(count or 1)))
+    return keys
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run compiled Jack VM code headlessly and count instructions.")
+    parser.add_argument('path', help="<file.vm|directory>; in a directory, a linked <dir>.vm is "
+                                     "run instead of the per-class .vm files when it is the newest")
+    parser.add_argument('--max-steps', type=int, default=50_000_000)
+    parser.add_argument('--keys', default='', help="keyPressed script, e.g. '0*500,140*10'")
+    parser.add_argument('--input', action='append', default=[],
+                        help="value returned by the next readInt/readLine/readChar (repeatable)")
+    parser.add_argument('--top', type=int, default=20, help="functions (and source lines) to list")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+    vm = VMInterpreter(vmFiles(args.path), keys=parseKeys(args.keys), inputs=args.input)
+    try:
+        vm.run(max_steps=args.max_steps)
+    except VMError as e:
+        print(f"VM error: {e}", file=sys.stderr)
+    if args.json:
+        print(json.dumps(vm.toJSON(), indent=2))
+    else:
+        output = ''.join(vm.os.output)
+        if output:
+            print("Output:")
+            print(output)
+        print(vm.report(args.top))
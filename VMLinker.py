@@ -0,0 +1,219 @@
+from VMWriter import Op, formatInstruction, ARGUMENT, CONSTANT, THIS, THAT, POINTER, TEMP
+
+# Whole-program passes over the blocks of a linked VMWriter: everything the
+# compiler produced for a directory, after the writeInit bootstrap.
+
+# The OS's Sys.init calls Main.main, so it is reachable even though no
+# compiled code calls it.
+ENTRY_POINTS = ('Sys.init', 'Main.main')
+
+def functionBlocks(writer):
+    # {function name: block} for every compiled subroutine
+    return {block[0][1]: block for block in writer.blocks
+            if block and block[0][0] == Op.FUNCTION}
+
+def callGraph(writer):
+    # {caller: set of callees}; code outside any function is keyed by None
+    graph = {}
+    for block in writer.blocks:
+        caller = block[0][1] if block and block[0][0] == Op.FUNCTION else None
+        callees = graph.setdefault(caller, set())
+        for ins in block:
+            if ins[0] == Op.CALL:
+                callees.add(ins[1])
+    return graph
+
+def reachableFunctions(writer, entry_points=ENTRY_POINTS):
+    graph = callGraph(writer)
+    seen = set()
+    todo = list(entry_points) + list(graph.get(None, ()))
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        todo.extend(graph.get(name, ()))
+    return seen
+
+_DISCARD = (Op.POP, TEMP, 0)
+_DUMMY_RESULT = (Op.PUSH, CONSTANT, 0)
+
+def checkCalls(writer, index, entry_points=ENTRY_POINTS):
+    # Calls into project classes that the ClassIndex says cannot work:
+    # [(caller, callee, problem)]. OS classes are not in the index and
+    # are not checked. As in voidConvention, the result of an entry point
+    # counts as discarded: the bootstrap's 'call Sys.init 0' has no pop.
+    compiled = functionBlocks(writer)
+    problems = []
+    for block in writer.blocks:
+        caller = block[0][1] if block and block[0][0] == Op.FUNCTION else None
+        for i, ins in enumerate(block):
+            if ins[0] != Op.CALL:
+                continue
+            class_name, _, name = ins[1].partition('.')
+            if class_name not in index.classes:
+                continue
+            signature = index.subroutine(class_name, name)
+            if signature is None:
+                if ins[1] not in compiled:
+                    problems.append((caller, ins[1], "no such subroutine"))
+                continue
+            expected = signature[2] + (signature[0] == 'method')
+            if ins[2] != expected:
+                problems.append((caller, ins[1], f"called with {ins[2]} arguments, takes {expected}"))
+            elif (signature[1] == 'void' and ins[1] not in entry_points
+                  and block[i + 1:i + 2] != [_DISCARD]):
+                # keeps its dummy 0 (see dropVoidResults)
+                problems.append((caller, ins[1], "uses the result of a void subroutine"))
+    return problems
+
+def voidConvention(writer, index, entry_points=ENTRY_POINTS):
+    # The project's void subroutines whose every call site throws the result
+    # away (call; pop temp 0). Entry points count as discarded: the OS's
+    # Sys.init ignores what Main.main returns.
+    candidates = set()
+    for name in functionBlocks(writer):
+        class_name, _, sub = name.partition('.')
+        signature = index.subroutine(class_name, sub)
+        if signature is not None and signature[1] == 'void':
+            candidates.add(name)
+    for block in writer.blocks:
+        for i, ins in enumerate(block):
+            if (ins[0] == Op.CALL and ins[1] in candidates
+                    and (i + 1 == len(block) or block[i + 1] != _DISCARD)):
+                candidates.discard(ins[1])
+    return candidates
+
+def dropVoidResults(writer, index):
+    # Void calling convention for whole programs: a void subroutine whose
+    # result nobody reads returns whatever is on top of its stack instead of
+    # a pushed 0. The VM's return always hands the caller one value, so call
+    # sites keep their 'pop temp 0', except a call in tail position
+    # (call; pop temp 0; push constant 0; return), which returns the callee's
+    # value directly. Calls into OS classes are untouched.
+    # Returns (dummy pushes removed, tail calls).
+    void = voidConvention(writer, index)
+    dropped = tails = 0
+    for block in writer.blocks:
+        if not block or block[0][0] != Op.FUNCTION or block[0][1] not in void:
+            continue
+        out = []
+        for ins in block:
+            if ins[0] == Op.RETURN and out and out[-1] == _DUMMY_RESULT:
+                out.pop()
+                dropped += 1
+                if len(out) >= 2 and out[-1] == _DISCARD and out[-2][0] == Op.CALL:
+                    out.pop()
+                    tails += 1
+            out.append(ins)
+        block[:] = out
+    return dropped, tails
+
+def formatVoidResults(dropped, tails):
+    return f"  {dropped} dummy results removed, {tails} calls returned in tail position"
+
+def eliminateDeadFunctions(writer, entry_points=ENTRY_POINTS):
+    # Drop every function that cannot be reached from the entry points.
+    # Returns [(function name, instructions, bytes)] for the removed ones.
+    live = reachableFunctions(writer, entry_points)
+    removed = []
+    kept = []
+    for block in writer.blocks:
+        if block and block[0][0] == Op.FUNCTION and block[0][1] not in live:
+            size = sum(len(formatInstruction(ins)) for ins in block)
+            removed.append((block[0][1], len(block), size))
+        else:
+            kept.append(block)
+    writer.blocks[:] = kept
+    writer.code = None
+    return removed
+
+def formatRemoved(removed):
+    lines = [f"  {name:<40} {count:>6} instr {size:>7} bytes" for name, count, size in removed]
+    lines.append(f"  {len(removed)} functions removed, "
+                 f"{sum(r[1] for r in removed)} instructions, {sum(r[2] for r in removed)} bytes saved")
+    return '\n'.join(lines)
+
+
+# Instructions inlining may add to the program, across all call sites
+INLINE_BUDGET = 2000
+
+_METHOD_PROLOGUE = ((Op.PUSH, ARGUMENT, 0), (Op.POP, POINTER, 0))
+
+def findAccessors(writer):
+    # {method name: ('get', field index) | ('set', field index, argument)}
+    # for methods whose whole body is 'return field;' or 'let field = arg;
+    # return;'. This compiler numbers a method's parameters from argument 0,
+    # the slot the object pointer is passed in, so its setters store
+    # argument 0 (the object); argument 1 is the conventional numbering.
+    accessors = {}
+    for name, block in functionBlocks(writer).items():
+        if block[0][2] != 0 or tuple(block[1:3]) != _METHOD_PROLOGUE:
+            continue
+        body = block[3:]
+        if (len(body) == 2 and body[0][:2] == (Op.PUSH, THIS)
+                and body[1][0] == Op.RETURN):
+            accessors[name] = ('get', body[0][2])
+        elif (len(body) == 4 and body[0][:2] == (Op.PUSH, ARGUMENT) and body[0][2] in (0, 1)
+                and body[1][:2] == (Op.POP, THIS)
+                and body[2] == (Op.PUSH, CONSTANT, 0) and body[3][0] == Op.RETURN):
+            accessors[name] = ('set', body[1][2], body[0][2])
+    return accessors
+
+def _inlineBlock(block, accessors, stats, budget):
+    # returns the rewritten block and the budget left
+    out = []
+    i = 0
+    while i < len(block):
+        ins = block[i]
+        target = accessors.get(ins[1]) if ins[0] == Op.CALL else None
+        if target is None:
+            out.append(ins)
+            i += 1
+            continue
+        kind, field = target[:2]
+        discarded = i + 1 < len(block) and block[i + 1] == (Op.POP, TEMP, 0)
+        if kind == 'get' and ins[2] == 1:
+            if out and out[-1] == (Op.PUSH, POINTER, 0):
+                # getter on this: read the field directly
+                out.pop()
+                code = [(Op.PUSH, THIS, field)]
+            else:
+                code = [(Op.POP, POINTER, 1), (Op.PUSH, THAT, field)]
+        elif kind == 'set' and ins[2] == 2:
+            # stack: object, value; store whichever the setter's body reads
+            stored = (Op.PUSH, TEMP, 1) if target[2] == 1 else (Op.PUSH, POINTER, 1)
+            code = [(Op.POP, TEMP, 1), (Op.POP, POINTER, 1), stored, (Op.POP, THAT, field)]
+            if not discarded:
+                code.append((Op.PUSH, CONSTANT, 0))
+        else:
+            out.append(ins)
+            i += 1
+            continue
+        consumed = 2 if kind == 'set' and discarded else 1
+        growth = len(code) - consumed
+        if growth > budget:
+            out.append(ins)
+            i += 1
+            continue
+        budget -= growth
+        out.extend(code)
+        stats[ins[1]] = stats.get(ins[1], 0) + 1
+        i += consumed
+    return out, budget
+
+def inlineAccessors(writer, budget=INLINE_BUDGET):
+    # Replace calls to trivial getter/setter methods with direct field
+    # access through pointer 1/that. Returns {method: sites inlined}.
+    accessors = findAccessors(writer)
+    stats = {}
+    if not accessors:
+        return stats
+    for block in writer.blocks:
+        block[:], budget = _inlineBlock(block, accessors, stats, budget)
+    return stats
+
+def formatInlined(stats):
+    lines = [f"  {name:<40} {count:>4} sites" for name, count in sorted(stats.items())]
+    lines.append(f"  {sum(stats.values())} call sites inlined")
+    return '\n'.join(lines)
@@ -0,0 +1,140 @@
+from VMWriter import Op, CONSTANT, THAT, POINTER, TEMP
+
+# Peephole optimizer over VMWriter instruction records. Rules look at the
+# tail of the output list each time an instruction is appended, so a
+# rewrite can expose the next one (e.g. 'not; not' left behind by another rule).
+# Each rule rewrites the tail in place and returns the number of
+# instructions it removed (0 if it did not match).
+
+def _pushConst(ins, value):
+    return ins[0] == Op.PUSH and ins[1] == CONSTANT and ins[2] == value
+
+def _doubleNegation(out):
+    # not; not  /  neg; neg
+    if len(out) >= 2 and out[-1][0] in (Op.NOT, Op.NEG) and out[-2][0] == out[-1][0]:
+        del out[-2:]
+        return 2
+    return 0
+
+def _constantBranch(out):
+    # push constant 0; if-goto L         -> (never taken)
+    # push constant 0; not; if-goto L    -> goto L
+    if len(out) >= 2 and out[-1][0] == Op.IF_GOTO:
+        if _pushConst(out[-2], 0):
+            del out[-2:]
+            return 2
+        if len(out) >= 3 and out[-2][0] == Op.NOT and _pushConst(out[-3], 0):
+            out[-3:] = [(Op.GOTO, out[-1][1], None)]
+            return 2
+    return 0
+
+def _identityArithmetic(out):
+    # push constant 0; add|sub|or  -> (nothing)
+    if len(out) >= 2 and out[-1][0] in (Op.ADD, Op.SUB, Op.OR) and _pushConst(out[-2], 0):
+        del out[-2:]
+        return 2
+    return 0
+
+def _pushPopSame(out):
+    # push S i; pop S i  -> (nothing)
+    if (len(out) >= 2 and out[-1][0] == Op.POP and out[-2][0] == Op.PUSH
+            and out[-1][1:] == out[-2][1:]):
+        del out[-2:]
+        return 2
+    return 0
+
+_ARRAY_STORE = ((Op.POP, TEMP, 0), (Op.POP, POINTER, 1), (Op.PUSH, TEMP, 0), (Op.POP, THAT, 0))
+
+def _arrayStoreTemp(out):
+    # push X; pop temp 0; pop pointer 1; push temp 0; pop that 0
+    #   -> pop pointer 1; push X; pop that 0
+    # when X is a single push that does not read 'that' or 'pointer 1'
+    if len(out) >= 5 and tuple(out[-4:]) == _ARRAY_STORE:
+        value = out[-5]
+        if value[0] == Op.PUSH and value[1] != THAT and value[1:] != (POINTER, 1):
+            out[-5:] = [(Op.POP, POINTER, 1), value, (Op.POP, THAT, 0)]
+            return 2
+    return 0
+
+def _jumpToNext(out):
+    # goto L; label ...; label L  -> label ...; label L
+    if out and out[-1][0] == Op.LABEL:
+        target = out[-1][1]
+        i = len(out) - 1
+        while i > 0 and out[i - 1][0] == Op.LABEL:
+            i -= 1
+        if i > 0 and out[i - 1][0] == Op.GOTO and out[i - 1][1] == target:
+            del out[i - 1]
+            return 1
+    return 0
+
+RULES = [
+    ('double-negation', _doubleNegation),
+    ('constant-branch', _constantBranch),
+    ('identity-arithmetic', _identityArithmetic),
+    ('push-pop-same', _pushPopSame),
+    ('array-store-temp', _arrayStoreTemp),
+    ('jump-to-next', _jumpToNext),
+]
+
+def _peephole(code, stats):
+    out = []
+    for ins in code:
+        out.append(ins)
+        matched = True
+        while matched and out:
+            matched = False
+            for name, rule in RULES:
+                removed = rule(out)
+                if removed:
+                    stats[name] = stats.get(name, 0) + removed
+                    matched = True
+                    break
+    return out
+
+def _removeUnreachable(code, stats):
+    # drop everything after goto/return up to the next label
+    out = []
+    dead = False
+    for ins in code:
+        if ins[0] == Op.LABEL or ins[0] == Op.FUNCTION:
+            dead = False
+        if dead:
+            stats['unreachable'] = stats.get('unreachable', 0) + 1
+            continue
+        out.append(ins)
+        if ins[0] in (Op.GOTO, Op.RETURN):
+            dead = True
+    return out
+
+def _removeUnusedLabels(code, stats):
+    # labels are function-scoped, so only jumps in this block can reach them
+    used = {ins[1] for ins in code if ins[0] in (Op.GOTO, Op.IF_GOTO)}
+    out = [ins for ins in code if ins[0] != Op.LABEL or ins[1] in used]
+    if len(out) != len(code):
+        stats['unused-label'] = stats.get('unused-label', 0) + len(code) - len(out)
+    return out
+
+def optimizeFunction(code, stats):
+    # Run the passes until nothing changes; returns the new instruction list
+    while True:
+        before = len(code)
+        code = _peephole(code, stats)
+        code = _removeUnreachable(code, stats)
+        code = _removeUnusedLabels(code, stats)
+        if len(code) == before:
+            return code
+
+def optimize(writer):
+    # Optimize every subroutine block collected by a VMWriter, in place.
+    # Returns {rule name: instructions removed}.
+    stats = {}
+    for block in writer.blocks:
+        if block and block[0][0] == Op.FUNCTION:
+            block[:] = optimizeFunction(block, stats)
+    return stats
+
+def formatStats(stats):
+    lines = [f"  {name:<20} -{count}" for name, count in sorted(stats.items())]
+    lines.append(f"  {'total':<20} -{sum(stats.values())}")
+    return '\n'.join(lines)
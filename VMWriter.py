@@ -1,27 +1,179 @@
+from enum import IntEnum
+
+class Op(IntEnum):
+    PUSH = 0
+    POP = 1
+    ADD = 2
+    SUB = 3
+    NEG = 4
+    EQ = 5
+    GT = 6
+    LT = 7
+    AND = 8
+    OR = 9
+    NOT = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    FUNCTION = 14
+    CALL = 15
+    RETURN = 16
+
+# Segment codes used in push/pop records
+SEGMENTS = ('constant', 'argument', 'local', 'static', 'this', 'that', 'pointer', 'temp')
+SEGMENT_CODES = {name: code for code, name in enumerate(SEGMENTS)}
+CONSTANT, ARGUMENT, LOCAL, STATIC, THIS, THAT, POINTER, TEMP = range(len(SEGMENTS))
+
+ARITHMETIC = {'add': Op.ADD, 'sub': Op.SUB, 'neg': Op.NEG, 'eq': Op.EQ, 'gt': Op.GT,
+              'lt': Op.LT, 'and': Op.AND, 'or': Op.OR, 'not': Op.NOT}
+OP_NAMES = {op: name for name, op in ARITHMETIC.items()}
+OP_NAMES.update({Op.PUSH: 'push', Op.POP: 'pop', Op.LABEL: 'label', Op.GOTO: 'goto',
+                 Op.IF_GOTO: 'if-goto', Op.FUNCTION: 'function', Op.CALL: 'call',
+                 Op.RETURN: 'return'})
+_NAME_OPS = {name: op for op, name in OP_NAMES.items()}
+_LABEL_OPS = (Op.LABEL, Op.GOTO, Op.IF_GOTO)
+_NAMED_OPS = (Op.FUNCTION, Op.CALL)
+
+# Instructions are (op, a, b) tuples:
+#   push/pop          (op, segment code, index)
+#   label/goto/if-goto (op, label, None)
+#   function/call     (op, name, nLocals|nArgs)
+#   arithmetic/return (op, None, None)
+
+def formatInstruction(ins):
+    op, a, b = ins
+    if op <= Op.POP:
+        return f"{OP_NAMES[op]} {SEGMENTS[a]} {b}\n"
+    if op in _LABEL_OPS:
+        return f"{OP_NAMES[op]} {a}\n"
+    if op in _NAMED_OPS:
+        return f"{OP_NAMES[op]} {a} {b}\n"
+    return OP_NAMES[op] + "\n"
+
+def parseVM(text):
+    # VM text back into instruction records
+    code = []
+    for line in text.splitlines():
+        parts = line.split('//', 1)[0].split()
+        if not parts:
+            continue
+        op = _NAME_OPS[parts[0]]
+        if op <= Op.POP:
+            code.append((op, SEGMENT_CODES[parts[1]], int(parts[2])))
+        elif op in _LABEL_OPS:
+            code.append((op, parts[1], None))
+        elif op in _NAMED_OPS:
+            code.append((op, parts[1], int(parts[2])))
+        else:
+            code.append((op, None, None))
+    return code
+
+def splitFunctions(code):
+    # Split a flat instruction list into blocks, each starting at a 'function'
+    blocks = [[]]
+    for ins in code:
+        if ins[0] == Op.FUNCTION:
+            blocks.append([])
+        blocks[-1].append(ins)
+    if not blocks[0]:
+        blocks.pop(0)
+    return blocks
+
+
 class VMWriter:
-    def __init__(self, output_file):
-        self.file = open(output_file, 'w')
+    def __init__(self, output_file=None):
+        # output_file is a path, an already open text stream, or None to only
+        # collect the instructions (see serialize())
+        if isinstance(output_file, str):
+            self.file = open(output_file, 'w')
+        else:
+            self.file = output_file
+        # one instruction list per subroutine; code before the first
+        # function (the bootstrap) gets a block of its own
+        self.blocks = []
+        self.code = None
+        # source positions, only collected after trackOrigins(): id(record) ->
+        # (record, origin). Holding the record keeps its id from being reused
+        # once a pass drops it.
+        self.origins = None
+        self.where = None
+    def trackOrigins(self):
+        self.origins = {}
+    def _emit(self, ins):
+        if self.code is None:
+            self.code = []
+            self.blocks.append(self.code)
+        self.code.append(ins)
+        if self.origins is not None:
+            self.origins[id(ins)] = (ins, self.where)
     def writeInit(self):
         # bootstrap stack pointer and call Sys.init
         self.writePush('constant', 256)
         self.writeCall('Sys.init', 0)
     def writePush(self, segment, index):
-        self.file.write(f"push {segment} {index}\n")
+        self._emit((Op.PUSH, SEGMENT_CODES[segment], index))
     def writePop(self, segment, index):
-        self.file.write(f"pop {segment} {index}\n")
+        self._emit((Op.POP, SEGMENT_CODES[segment], index))
     def writeArithmetic(self, command):
-        self.file.write(f"{command}\n")
+        if command not in ARITHMETIC:
+            raise ValueError(f"Unknown arithmetic command: {command}")
+        self._emit((ARITHMETIC[command], None, None))
     def writeLabel(self, label):
-        self.file.write(f"label {label}\n")
+        self._emit((Op.LABEL, label, None))
     def writeGoto(self, label):
-        self.file.write(f"goto {label}\n")
+        self._emit((Op.GOTO, label, None))
     def writeIf(self, label):
-        self.file.write(f"if-goto {label}\n")
+        self._emit((Op.IF_GOTO, label, None))
     def writeCall(self, name, nArgs):
-        self.file.write(f"call {name} {nArgs}\n")
+        self._emit((Op.CALL, name, nArgs))
     def writeFunction(self, name, nLocals):
-        self.file.write(f"function {name} {nLocals}\n")
+        self.code = []
+        self.blocks.append(self.code)
+        self._emit((Op.FUNCTION, name, nLocals))
     def writeReturn(self):
-        self.file.write("return\n")
+        self._emit((Op.RETURN, None, None))
+    def insert(self, position, code):
+        # splice instruction records into the current subroutine block
+        self.code[position:position] = code
+        if self.origins is not None:
+            for ins in code:
+                self.origins[id(ins)] = (ins, self.where)
+    def writeFragment(self, text, origins=None):
+        # append VM code that was already compiled elsewhere (worker process,
+        # cache); origins, if given, has one entry per instruction in text
+        self.writeCode(parseVM(text), origins)
+    def writeCode(self, code, origins=None):
+        # append already parsed instruction records; the records are shared,
+        # the block lists are not
+        for block in splitFunctions(code):
+            if block[0][0] == Op.FUNCTION:
+                self.code = block
+                self.blocks.append(block)
+            else:
+                for ins in block:
+                    self._emit(ins)
+        if self.origins is not None and origins is not None:
+            for ins, origin in zip(code, origins):
+                self.origins[id(ins)] = (ins, origin)
+    def lineTable(self):
+        # origin of every instruction, in output order. Records created by
+        # later passes inherit the origin of the instruction before them.
+        table = []
+        for block in self.blocks:
+            last = None
+            for ins in block:
+                entry = self.origins.get(id(ins))
+                if entry is not None and entry[0] is ins:
+                    last = entry[1]
+                table.append(last)
+        return table
+    def instructions(self):
+        for block in self.blocks:
+            yield from block
+    def serialize(self):
+        return ''.join(map(formatInstruction, self.instructions()))
     def close(self):
-        self.file.close()
\ No newline at end of file
+        # one bulk write of everything collected so far
+        if self.file is not None:
+            self.file.write(self.serialize())
+            self.file.close()